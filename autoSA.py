@@ -8,11 +8,14 @@ __email__   = "japaza@igp.gob.pe"
 ##########################################################################################
 
 import os
-import subprocess
-from datetime import datetime
-from time import sleep
-import h5py
-from libreVNA import libreVNA
+from saConfig import saConfig
+from recorder import saRecorder, revisitRecorder
+from supervisor import acqSupervisor
+from metrics import metrics
+from averaging import sweepAverager
+from retention import retentionManager
+from guiLauncher import guiLauncher
+from scheduler import adaptiveScheduler
 NPOINTS = 1001
 
 ##########################################################################################
@@ -20,6 +23,8 @@ NPOINTS = 1001
 ##########################################################################################
 ################################ CONFIG PARAMETERS  ######################################
 pathVNAgui = "/home/japaza/Documents/MRI/LibreVNA-GUI"
+headless = True         #--no-gui, set xvfb = True instead for GUI versions without it
+xvfb = False
 outPath = "/home/japaza/Documents/MRI/LibreVNApy/out/"
 RBW = 50
 minF = 1
@@ -27,7 +32,19 @@ maxF = 100
 window = "KAISER"
 detector = "AVERAGE"
 navg = 1
+hostAvg = 1             #sweeps averaged on the host in linear power, use it with navg = 1
+hostMode = "block"      #block, sliding, exp, maxhold or minhold (see averaging.py)
 nblocks = 3
+metricsPort = None      #e.g. 9105 to expose http://localhost:9105/metrics
+metricsFile = None      #e.g. outPath+"metrics.prom", rewritten every 10 s
+rawDays = None          #e.g. 7: older days are compacted into outPath/archive (see retention.py)
+compactInterval = 600   #seconds per compacted row
+diskBudgetGB = None     #raw + compacted size limit (revisits included), the oldest compacted files are removed
+adaptive = False        #revisit the active bands at finer RBW, stored in outPath/revisit (see scheduler.py)
+revisitRBW = 5          #KHz
+revisitSpan = 2         #MHz
+revisitBudget = 0.25    #revisit seconds per survey second
+activeThreshold = 10    #dB over the median floor
 
 
 ##########################################################################################
@@ -36,98 +53,73 @@ nblocks = 3
 ##########################################################################################
 
 
-#os.system(pathVNAgui)
-subprocess.call(["gnome-terminal", "-x", "sh", "-c", pathVNAgui])
+#start the GUI as a child process, restarted if it crashes
+gui = guiLauncher(pathVNAgui, 19542, headless=headless, xvfb=xvfb)
+gui.start()
+gui.supervise()
 
-sleep(1)
 print("Setting VNA parameters")
-vna = libreVNA('localhost', 19542)
-vna.connect()
-#vna.connect("2069358B3750")
-sleep(1)
-
-while(not vna.set_mode("SA")):
-    sleep(1)
-
-
-#frequency range 1 to 100 MHz
-vna.set_saStart(minF)
-vna.set_saStop(maxF)
-sleep(0.1)
-#Resolution bandwidth set to 12KHz
-vna.set_saRBW(RBW)
-sleep(0.1)
-#Acquisition window set to kaiser
-vna.set_saWindow(window)
-sleep(0.1)
-#Configuring the detector as Average
-vna.set_saDetector(detector)
-sleep(0.1)
-#number of integrations
-vna.set_saAvgNumber(navg)
-sleep(0.1)
-#IMPORTANT TO SET THIS
-vna.set_saSignalID(True)
-
-
-
-def newFile(name, columns, freq):
-    f = h5py.File(name, 'w')
-    a = f.create_group('Data')
-            
-    b = f.create_group('MetaData')
-    b.attrs['Start Frequency'] = minF*1000000
-    b.attrs['Stop Frequency'] = maxF*1000000
-    b.attrs['Resolution Frequency'] = RBW*1000
-    b.attrs['window'] = window
-    b.attrs['detector'] = detector
-    b.attrs['navg'] = navg
-    a.create_dataset("dBm", (nblocks,columns, 2), maxshape=(500, columns, 2))
-    a.create_dataset("frequency", (columns,), data=freq)
-    a.create_dataset("datetime", (nblocks,), maxshape=(500,))
-
-    a.create_dataset("LOtemperature", (nblocks,), maxshape=(500,))
-    a.create_dataset("CPUtemperature", (nblocks,), maxshape=(500,))
-    return f
-
-block = 0
-while( vna.get_saCurrentAvg() < 1):
-    sleep(1)
-dat = vna.get_saData()
-(dim, length) = dat.shape
-freqs = dat[0, :]
-f = None
-while(True):
-    
-    if (vna.get_saCurrentAvg()==navg):
-        if block==nblocks or block==0:
-            try:
-                f.close()
-            except:
-                pass
-            filename = "spc_"+datetime.now().strftime("%Y%m%d-%H%M%S")+".h5"
-            try:
-                fullFile = os.path.join(outPath, filename)
-            except:
-                print("Output path does not exist")
-                SystemExit(-1)
-            print("Creating file -> ", filename)
-            f = newFile(fullFile,length,freqs )
-            block = 0
-
-        data = vna.get_saData(port=1)
-        time = datetime.now().timestamp() 
-        dset = f["Data/dBm"]
-        #print(dset, dset.shape)
-        utc =  f["Data/datetime"]
-        dset[block,:,0] = data[1] #update dBm = data[1] port 1
-        data = vna.get_saData(port=2)
-        dset[block,:,1] = data[1] #update dBm = data[1] port 2
-        utc[block] = time #update dBm data
-        f["Data/LOtemperature"][block] = vna.get_loTemp()
-        f["Data/CPUtemperature"][block] = vna.get_cpuTemp()
-        block+=1
-        vna.set_saAvgNumber(navg, msg=False) #restart the acquisition
-
-
-
+#frequency range, RBW, window, detector and number of integrations
+#signal ID is IMPORTANT TO SET, only the settings that differ are sent
+config = saConfig(start=minF, stop=maxF, rbw=RBW, window=window, detector=detector, navg=navg, signalID=True)
+#the supervisor connects (or reconnects after a GUI timeout) and applies the configuration
+supervisor = acqSupervisor(config, 'localhost', 19542)
+#supervisor = acqSupervisor(config, 'localhost', 19542, device="2069358B3750")
+monitor = None
+if metricsPort is not None or metricsFile is not None:
+    monitor = metrics()
+    if metricsPort is not None:
+        monitor.serve(metricsPort)
+    if metricsFile is not None:
+        monitor.dumpEvery(metricsFile)
+supervisor.metrics = monitor
+supervisor.recover()
+
+
+averager = sweepAverager(hostMode, hostAvg)
+
+def acquire(vna):
+    #one triggered sweep, both ports from the same sweep
+    sweep = vna.acquire_sweep()
+    if hostAvg > 1 or hostMode != "block":
+        dBm = averager.add(sweep.dBm)
+        if dBm is None:
+            return None
+        sweep = sweep._replace(dBm=dBm)
+    return sweep
+
+
+#SWMR so liveMonitor.py can follow the file being written
+recorder = saRecorder(outPath, config, nblocks, swmr=True,
+                      averager=averager if hostAvg > 1 or hostMode != "block" else None)
+recorder.metrics = monitor
+retentions = []
+if rawDays is not None:
+    retention = retentionManager(outPath, rawDays, compactInterval,
+                                 None if diskBudgetGB is None else diskBudgetGB*1e9)
+    retentions.append(retention)
+step = acquire
+if adaptive:
+    revisitPath = os.path.join(outPath, "revisit")
+    os.makedirs(revisitPath, exist_ok=True)
+    revisits = revisitRecorder(revisitPath, saConfig(minF, maxF, revisitRBW, window, detector, navg, True))
+    scheduler = adaptiveScheduler(config, revisits, revisitRBW, revisitSpan, revisitBudget, activeThreshold)
+    scheduler.acquire = acquire
+    scheduler.metrics = monitor
+    step = scheduler.step
+    if rawDays is not None:
+        #revisits are compacted into revisit/archive and counted in the survey's disk budget
+        revisitRetention = retentionManager(revisitPath, rawDays, compactInterval, prefix="rev_")
+        retention.companions.append(revisitRetention)
+        retentions.append(revisitRetention)
+for r in retentions:
+    r.start()
+try:
+    supervisor.run(step, recorder)
+finally:
+    recorder.close()
+    if adaptive:
+        revisits.close()
+    for r in retentions:
+        r.stop()
+    gui.stop()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+"""autoVNA.py:
+Unattended S-parameter recording, VNA counterpart of autoSA.py
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##########################################################################################
+
+from vnaConfig import vnaConfig
+from recorder import vnaRecorder
+from supervisor import acqSupervisor
+from guiLauncher import guiLauncher
+
+##########################################################################################
+##########################################################################################
+##########################################################################################
+################################ CONFIG PARAMETERS  ######################################
+pathVNAgui = "/home/japaza/Documents/MRI/LibreVNA-GUI"
+outPath = "/home/japaza/Documents/MRI/LibreVNApy/outVNA/"
+minF = 1
+maxF = 100
+points = 501
+IFBW = 1
+power = -10
+navg = 1
+traces = ["S11", "S12", "S21", "S22"]
+nblocks = 100
+
+
+##########################################################################################
+##########################################################################################
+##########################################################################################
+##########################################################################################
+
+
+gui = guiLauncher(pathVNAgui, 19542)
+gui.start()
+gui.supervise()
+
+print("Setting VNA parameters")
+config = vnaConfig(start=minF, stop=maxF, points=points, ifbw=IFBW, power=power, navg=navg, traces=traces)
+supervisor = acqSupervisor(config, 'localhost', 19542, mode="VNA")
+supervisor.recover()
+
+
+def acquire(vna):
+    #one triggered sweep, all the traces are read from it
+    return vna.acquire_vnaSweep(traces)
+
+
+recorder = vnaRecorder(outPath, config, nblocks)
+try:
+    supervisor.run(acquire, recorder)
+finally:
+    recorder.close()
+    gui.stop()
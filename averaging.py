@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""averaging.py:
+Host-side averaging and hold of raw sweeps, so the device can run with
+navg=1 and never restart its own average.
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##########################################################################################
+
+import numpy as np
+
+MODES = ["block", "sliding", "exp", "maxhold", "minhold"]
+
+
+class sweepAverager():
+
+    def __init__(self, mode="block", n=10, linear=True):
+        '''
+        mode: block    mean of every n sweeps, an output each n sweeps
+              sliding  mean of the last n sweeps, an output each sweep
+              exp      exponential average with alpha = 1/n
+              maxhold  per bin maximum, restarted every n sweeps (n=None holds forever)
+              minhold  per bin minimum, restarted every n sweeps (n=None holds forever)
+        linear: average in linear power (mW) instead of dB, hold modes are the same in both
+        Sweeps are arrays in dBm of any shape, e.g. (points, 2) for both ports
+        '''
+        if mode not in MODES:
+            raise ValueError("Invalid averaging mode <{}>".format(", ".join(MODES)))
+        self.mode = mode
+        self.linear = linear
+        self.setWindow(n)
+
+    def setWindow(self, n):
+        if n is None and self.mode not in ["maxhold", "minhold"]:
+            raise ValueError("Averaging window needed in {} mode, n=None only holds forever".format(self.mode))
+        if n is not None and n < 1:
+            raise ValueError("Invalid averaging window")
+        self.n = n
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.acc = None
+        self.buffer = None
+        self.pos = 0
+
+    def toLinear(self, dBm):
+        return np.power(10.0, np.asarray(dBm, dtype=float)/10) if self.linear else np.asarray(dBm, dtype=float)
+
+    def toDB(self, value):
+        return 10*np.log10(value) if self.linear else value
+
+    def add(self, dBm):
+        '''
+        Feed one sweep, returns the averaged sweep in dBm or None while a block is filling
+        '''
+        if self.mode in ["maxhold", "minhold"]:
+            return self.hold(np.asarray(dBm, dtype=float))
+
+        x = self.toLinear(dBm)
+        if self.mode == "block":
+            self.acc = x.copy() if self.acc is None else self.acc + x
+            self.count += 1
+            if self.count < self.n:
+                return None
+            out = self.acc/self.count
+            self.reset()
+            return self.toDB(out)
+
+        if self.mode == "exp":
+            alpha = 1.0/self.n
+            self.acc = x.copy() if self.acc is None else self.acc + alpha*(x - self.acc)
+            return self.toDB(self.acc)
+
+        #sliding window, ring buffer and running sum
+        if self.buffer is None or self.buffer.shape[1:] != x.shape:
+            self.buffer = np.empty((self.n,)+x.shape)
+            self.acc = np.zeros(x.shape)
+            self.count = 0
+            self.pos = 0
+        if self.count == self.n:
+            self.acc -= self.buffer[self.pos]
+        else:
+            self.count += 1
+        self.buffer[self.pos] = x
+        self.acc += x
+        self.pos = (self.pos + 1) % self.n
+        if self.pos == 0:
+            #recompute once per turn so rounding errors do not build up
+            self.acc = self.buffer[:self.count].sum(axis=0)
+        return self.toDB(self.acc/self.count)
+
+    def hold(self, x):
+        if self.acc is None:
+            self.acc = x.copy()
+        elif self.mode == "maxhold":
+            np.maximum(self.acc, x, out=self.acc)
+        else:
+            np.minimum(self.acc, x, out=self.acc)
+        self.count += 1
+        out = self.acc.copy()
+        if self.n is not None and self.count >= self.n:
+            self.reset()
+        return out
+
+
+class averagingEngine():
+    '''
+    Several output streams fed from the same raw sweeps, each with its own
+    mode and window, e.g.
+        engine = averagingEngine({"avg": ("block", 10), "max": ("maxhold", 60)})
+    '''
+
+    def __init__(self, streams=None, linear=True):
+        self.streams = {}
+        self.linear = linear
+        for name, (mode, n) in (streams or {}).items():
+            self.addStream(name, mode, n)
+
+    def addStream(self, name, mode="block", n=10):
+        self.streams[name] = sweepAverager(mode, n, self.linear)
+
+    def setWindow(self, name, n):
+        self.streams[name].setWindow(n)
+
+    def add(self, dBm):
+        '''
+        Feed one sweep to every stream, returns {name: averaged sweep} of the streams with an output
+        '''
+        out = {}
+        for name, avg in self.streams.items():
+            y = avg.add(dBm)
+            if y is not None:
+                out[name] = y
+        return out
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+
+"""benchmark.py:
+Micro and scaling benchmarks of the trace parsing, socket reader, HDF5
+writing and archive loading paths, with synthetic data.
+Results are written as JSON to compare revisions:
+
+    python3 benchmark.py --out before.json
+    python3 benchmark.py --out after.json
+    python3 benchmark.py --compare before.json after.json
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##########################################################################################
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+import contextlib
+from types import SimpleNamespace
+import numpy as np
+import h5py
+from libreVNA import libreVNA, SocketStreamReader, saSweep
+from recorder import saRecorder
+from readVNA import spectraVNA
+
+
+##########################################################################################
+#                                   SYNTHETIC DATA
+##########################################################################################
+
+def traceString(npoints, seed=0):
+    '''
+    SA trace as returned by :SA:TRAC:DATA?
+    '''
+    rng = np.random.default_rng(seed)
+    freq = np.linspace(1e6, 100e6, npoints)
+    dBm = rng.normal(-90, 3, npoints)
+    return ",".join("[{:g},{:g}]".format(f, d) for f, d in zip(freq, dBm))
+
+
+def makeArchive(path, nfiles, nblocks=3, npoints=1001):
+    '''
+    nfiles spc_*.h5 files written through saRecorder, as autoSA does
+    '''
+    config = SimpleNamespace(start=1, stop=100, rbw=50, window="KAISER", detector="AVERAGE", navg=1)
+    rec = saRecorder(path, config, nblocks)
+    freq = np.linspace(1e6, 100e6, npoints)
+    rng = np.random.default_rng(0)
+    t = 1.7e9
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        writeArchive(rec, nfiles, nblocks, freq, rng, t)
+
+
+def writeArchive(rec, nfiles, nblocks, freq, rng, t):
+    for i in range(nfiles):
+        for b in range(nblocks):
+            rec.write(saSweep(t, freq, rng.normal(-90, 3, (len(freq), 2)), 40.0, 41.0))
+            t += 10
+    rec.close()
+
+
+def timeit(func, repeat=5):
+    '''
+    best of repeat runs, seconds
+    '''
+    best = None
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+##########################################################################################
+#                                      BENCHMARKS
+##########################################################################################
+
+class traceServer():
+    '''
+    Minimal GUI stand-in answering every query with the same line
+    '''
+
+    def __init__(self, line):
+        self.line = (line + "\n").encode()
+        self.srv = socket.socket()
+        self.srv.bind(("localhost", 0))
+        self.srv.listen(1)
+        self.port = self.srv.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        c, _ = self.srv.accept()
+        f = c.makefile("rb")
+        for q in f:
+            c.sendall(self.line)
+
+
+def benchParse(sizes, repeat):
+    results = []
+    for n in sizes:
+        data = traceString(n)
+        srv = traceServer(data)
+        vna = libreVNA("localhost", srv.port)
+        vna.reader.timeout = 60
+        cases = {
+            "parse_SA_trace_data": lambda: libreVNA.parse_SA_trace_data(data),
+            "parse_SA_trace_array": lambda: libreVNA.parse_SA_trace_array(data),
+            "get_saData": lambda: vna.get_saData(1),
+        }
+        for name, func in cases.items():
+            t = timeit(func, repeat)
+            results.append({"bench": "parse", "case": name, "points": n, "seconds": t,
+                            "points_per_s": n/t})
+            print("parse {:22s} {:7d} points {:9.4f} s".format(name, n, t))
+    return results
+
+
+def benchReader(sizes, repeat, total=8000000):
+    '''
+    SocketStreamReader.readline throughput over a socketpair, lines of the given sizes
+    '''
+    results = []
+    for size in sizes:
+        line = b"x"*(size-1) + b"\n"
+        nlines = max(1, total//size)
+
+        def run():
+            a, b = socket.socketpair()
+            reader = SocketStreamReader(b)
+            reader.timeout = 60
+            writer = threading.Thread(target=lambda: [a.sendall(line) for i in range(nlines)])
+            writer.start()
+            for i in range(nlines):
+                reader.readline()
+            writer.join()
+            a.close()
+            b.close()
+
+        t = timeit(run, repeat)
+        results.append({"bench": "reader", "line_bytes": size, "lines": nlines, "seconds": t,
+                        "MB_per_s": nlines*size/t/1e6})
+        print("reader {:9d} B lines {:9.4f} s {:8.1f} MB/s".format(size, t, nlines*size/t/1e6))
+    return results
+
+
+def benchWrite(tmp, nsweeps, npoints=1001):
+    '''
+    HDF5 rows per second for chunk and batch settings, plus saRecorder.write
+    '''
+    results = []
+    rng = np.random.default_rng(0)
+    data = rng.normal(-90, 3, (nsweeps, npoints, 2)).astype('f4')
+    for chunk in [None, 1, 16, 128]:
+        for batch in [1, 10, 100]:
+            filename = os.path.join(tmp, "write.h5")
+            t0 = time.perf_counter()
+            with h5py.File(filename, 'w') as f:
+                if chunk is None:
+                    d = f.create_dataset("dBm", (nsweeps, npoints, 2), dtype='f4')
+                else:
+                    d = f.create_dataset("dBm", (0, npoints, 2), maxshape=(None, npoints, 2), dtype='f4',
+                                         chunks=(chunk, npoints, 2))
+                for i in range(0, nsweeps, batch):
+                    rows = data[i:i+batch]
+                    if chunk is not None:
+                        d.resize((i+len(rows), npoints, 2))
+                    d[i:i+len(rows)] = rows
+                    f.flush()
+            t = time.perf_counter() - t0
+            os.remove(filename)
+            results.append({"bench": "write", "chunk": chunk or "contiguous", "batch": batch,
+                            "sweeps": nsweeps, "seconds": t, "sweeps_per_s": nsweeps/t})
+            print("write chunk {:>10} batch {:4d} {:9.1f} sweeps/s".format(str(chunk or "contiguous"), batch, nsweeps/t))
+
+    out = os.path.join(tmp, "rec")
+    os.mkdir(out)
+    t = timeit(lambda: makeArchive(out, max(1, nsweeps//100), nblocks=100, npoints=npoints), 1)
+    shutil.rmtree(out)
+    results.append({"bench": "write", "chunk": "saRecorder", "batch": 1, "sweeps": nsweeps,
+                    "seconds": t, "sweeps_per_s": nsweeps/t})
+    print("write saRecorder                {:9.1f} sweeps/s".format(nsweeps/t))
+    return results
+
+
+def benchLoad(tmp, sizes):
+    '''
+    spectraVNA.getData time and peak memory (separate runs) for archives of n files
+    '''
+    results = []
+    for n in sizes:
+        path = os.path.join(tmp, "archive{}".format(n))
+        os.mkdir(path)
+        makeArchive(path, n)
+        files = spectraVNA().locateFiles(path)
+        #timed without tracemalloc, its overhead is only paid in the memory run
+        spc = spectraVNA()
+        t0 = time.perf_counter()
+        spc.getData(files, port=1)
+        t = time.perf_counter() - t0
+        tracemalloc.start()
+        spectraVNA().getData(files, port=1)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        shutil.rmtree(path)
+        results.append({"bench": "load", "files": n, "sweeps": spc.dBm.shape[0], "seconds": t,
+                        "peak_MB": peak/1e6, "data_MB": spc.dBm.nbytes/1e6})
+        print("load {:6d} files {:9.3f} s peak {:8.1f} MB".format(n, t, peak/1e6))
+    return results
+
+
+##########################################################################################
+
+def revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    '''
+    Print new/old time ratios of the cases present in both result files
+    '''
+    def key(r):
+        return tuple(sorted((k, str(v)) for k, v in r.items() if k not in ["seconds", "points_per_s", "MB_per_s",
+                                                                          "sweeps_per_s", "peak_MB", "data_MB"]))
+    with open(old) as f:
+        a = json.load(f)
+    with open(new) as f:
+        b = json.load(f)
+    before = {key(r): r for r in a["results"]}
+    print("{} -> {}".format(a.get("revision"), b.get("revision")))
+    for r in b["results"]:
+        o = before.get(key(r))
+        if o is None:
+            continue
+        desc = " ".join("{}={}".format(k, v) for k, v in key(r))
+        print("{:60s} {:8.3f}x time".format(desc, r["seconds"]/o["seconds"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LibreVNA_2RFI benchmarks")
+    parser.add_argument("--out", default=None, help="JSON file for the results")
+    parser.add_argument("--only", nargs="*", default=["parse", "reader", "write", "load"],
+                        choices=["parse", "reader", "write", "load"])
+    parser.add_argument("--quick", action="store_true", help="smaller sizes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    points = [1000, 10000] if args.quick else [1000, 10000, 100000]
+    lines = [64, 4096, 100000] if args.quick else [64, 4096, 100000, 2000000]
+    files = [10, 100] if args.quick else [10, 1000, 10000]
+    nsweeps = 200 if args.quick else 2000
+
+    results = []
+    tmp = tempfile.mkdtemp()
+    try:
+        if "parse" in args.only:
+            results += benchParse(points, args.repeat)
+        if "reader" in args.only:
+            results += benchReader(lines, args.repeat)
+        if "write" in args.only:
+            results += benchWrite(tmp, nsweeps)
+        if "load" in args.only:
+            results += benchLoad(tmp, files)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    report = {"revision": revision(), "date": time.time(), "python": sys.version.split()[0],
+              "numpy": np.__version__, "h5py": h5py.__version__, "machine": platform.machine(),
+              "results": results}
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+"""crossPol.py:
+Statistics between the two polarizations (port 1 = E-W, port 2 = N-S)
+of an archive: difference spectra, per bin correlation of the time series
+and which port dominates, computed in parallel over blocks of files.
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##############################################################################################
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import h5py
+from readVNA import spectraVNA
+
+
+def blockStats(files, interval, freq=None):
+    '''
+    Partial sums of a block of files, combinable with mergeStats()
+    sweeps are grouped in time bins of interval seconds
+    '''
+    s = None
+    for file in files:
+        try:
+            with h5py.File(file, 'r') as f:
+                fr = f["/Data/frequency"][:]
+                dBm = f["/Data/dBm"][:]
+                t = f["/Data/datetime"][:]
+        except Exception as e:
+            print("FILE->", file)
+            print(e)
+            continue
+        if freq is None:
+            freq = fr
+        elif len(fr) != len(freq) or not np.allclose(fr, freq):
+            print("FILE->", file, "different frequency axis, skipped")
+            continue
+        valid = t > 0
+        if dBm.ndim != 3 or not valid.any():
+            continue
+        p1 = dBm[valid, :, 0].astype(float)
+        p2 = dBm[valid, :, 1].astype(float)
+        t = t[valid]
+        diff = p1 - p2
+        dom = (p1 > p2)
+        if s is None:
+            nb = len(freq)
+            s = {"freq": freq, "n": 0, "s1": np.zeros(nb), "s2": np.zeros(nb), "s11": np.zeros(nb),
+                 "s22": np.zeros(nb), "s12": np.zeros(nb), "dom": np.zeros(nb), "bins": {}}
+        s["n"] += len(t)
+        s["s1"] += p1.sum(axis=0)
+        s["s2"] += p2.sum(axis=0)
+        s["s11"] += (p1*p1).sum(axis=0)
+        s["s22"] += (p2*p2).sum(axis=0)
+        s["s12"] += (p1*p2).sum(axis=0)
+        s["dom"] += dom.sum(axis=0)
+        #time resolved sums, one row per interval
+        keys = np.floor(t/interval).astype(np.int64)
+        for k in np.unique(keys):
+            sel = keys == k
+            d, c, n = s["bins"].get(k, (0, 0, 0))
+            s["bins"][k] = (d + diff[sel].sum(axis=0), c + dom[sel].sum(axis=0), n + sel.sum())
+    return s
+
+
+def referenceAxis(files):
+    '''
+    Frequency axis of the first readable file, every block is compared with it
+    '''
+    for file in files:
+        try:
+            with h5py.File(file, 'r') as f:
+                return f["/Data/frequency"][:]
+        except Exception as e:
+            print("FILE->", file)
+            print(e)
+    return None
+
+
+def mergeStats(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if len(a["freq"]) != len(b["freq"]) or not np.allclose(a["freq"], b["freq"]):
+        print("Block with a different frequency axis, skipped")
+        return a
+    for k in ["n", "s1", "s2", "s11", "s22", "s12", "dom"]:
+        a[k] = a[k] + b[k]
+    for k, (d, c, n) in b["bins"].items():
+        d0, c0, n0 = a["bins"].get(k, (0, 0, 0))
+        a["bins"][k] = (d0 + d, c0 + c, n0 + n)
+    return a
+
+
+class crossPolarization():
+
+    def __init__(self):
+        self.freq = None
+        self.n = 0
+        self.meanDiff = None    #mean port1 - port2 (dB) per bin
+        self.corr = None        #correlation of the port time series per bin
+        self.dominance = None   #fraction of sweeps where port 1 > port 2 per bin
+        self.dateTime = None    #start of each interval
+        self.diff = None        #mean difference (interval, bin)
+        self.domMap = None      #port 1 dominance fraction (interval, bin)
+        self.interval = None
+
+    def compute(self, files, interval=3600, blockSize=50, workers=None):
+        '''
+        files: archive (e.g. spectraVNA().locateFiles(path)), interval: seconds per time row
+        blocks of blockSize files are processed in parallel by workers processes
+        '''
+        blocks = [files[i:i+blockSize] for i in range(0, len(files), blockSize)]
+        #chosen once, so the files kept do not depend on where the blocks start
+        freq = referenceAxis(files)
+        total = None
+        if workers == 1 or len(blocks) <= 1:
+            for b in blocks:
+                total = mergeStats(total, blockStats(b, interval, freq))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for s in pool.map(blockStats, blocks, [interval]*len(blocks), [freq]*len(blocks)):
+                    total = mergeStats(total, s)
+        if total is None:
+            print("No data found")
+            return 0
+        self.finalize(total, interval)
+        return 1
+
+    def finalize(self, s, interval):
+        n = s["n"]
+        self.freq = s["freq"]
+        self.n = n
+        self.interval = interval
+        m1 = s["s1"]/n
+        m2 = s["s2"]/n
+        cov = s["s12"]/n - m1*m2
+        v1 = s["s11"]/n - m1*m1
+        v2 = s["s22"]/n - m2*m2
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.corr = cov/np.sqrt(v1*v2)
+        self.meanDiff = m1 - m2
+        self.dominance = s["dom"]/n
+        keys = sorted(s["bins"])
+        self.dateTime = np.array(keys, dtype=float)*interval
+        self.diff = np.array([s["bins"][k][0]/s["bins"][k][2] for k in keys])
+        self.domMap = np.array([s["bins"][k][1]/s["bins"][k][2] for k in keys])
+
+    def save(self, filename):
+        with h5py.File(filename, 'w') as f:
+            a = f.create_group('Data')
+            a.create_dataset("frequency", data=self.freq)
+            a.create_dataset("meanDiff", data=self.meanDiff)
+            a.create_dataset("correlation", data=self.corr)
+            a.create_dataset("dominance", data=self.dominance)
+            a.create_dataset("datetime", data=self.dateTime)
+            a.create_dataset("diff", data=self.diff)
+            a.create_dataset("domMap", data=self.domMap)
+            b = f.create_group('MetaData')
+            b.attrs['interval'] = self.interval
+            b.attrs['nsweeps'] = self.n
+
+    def load(self, filename):
+        with h5py.File(filename, 'r') as f:
+            self.freq = f["/Data/frequency"][:]
+            self.meanDiff = f["/Data/meanDiff"][:]
+            self.corr = f["/Data/correlation"][:]
+            self.dominance = f["/Data/dominance"][:]
+            self.dateTime = f["/Data/datetime"][:]
+            self.diff = f["/Data/diff"][:]
+            self.domMap = f["/Data/domMap"][:]
+            self.interval = f["/MetaData"].attrs['interval']
+            self.n = f["/MetaData"].attrs['nsweeps']
+
+    def spectra(self, kind="diff"):
+        '''
+        spectraVNA holding a result map, to use its plot2D/plotAvg:
+        diff (dB, port1 - port2) or dominance (fraction of sweeps port 1 > port 2)
+        '''
+        s = spectraVNA()
+        s.freq = self.freq
+        s.dateTime = self.dateTime
+        s.dBm = self.diff if kind == "diff" else self.domMap
+        s.empty = False
+        return s
+
+    def plot2D(self, kind="diff", vmin=None, vmax=None):
+        if kind == "diff":
+            self.spectra(kind).plot2D(-20 if vmin is None else vmin, 20 if vmax is None else vmax)
+        else:
+            self.spectra(kind).plot2D(0 if vmin is None else vmin, 1 if vmax is None else vmax)
+
+    def plotAvg(self):
+        from matplotlib import pyplot  as plt
+        x = self.freq/1000000  #To MHz
+        fig, ax = plt.subplots(3, 1, sharex=True, num=4)
+        ax[0].plot(x, self.meanDiff)
+        ax[0].set_ylabel("port1 - port2 dB")
+        ax[1].plot(x, self.corr)
+        ax[1].set_ylabel("correlation")
+        ax[2].plot(x, self.dominance)
+        ax[2].set_ylabel("port 1 dominance")
+        for a in ax:
+            a.grid()
+        ax[0].set_title('Cross polarization RFI')
+        plt.xlabel("MHz")
+        plt.show()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cross polarization statistics of an archive")
+    parser.add_argument("path", help="directory with the spc_*.h5 files")
+    parser.add_argument("--out", default=None, help="HDF5 file for the results")
+    parser.add_argument("--interval", type=float, default=3600, help="seconds per time row")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--plot", default=None, choices=["diff", "dominance", "avg"])
+    args = parser.parse_args(argv)
+
+    files = spectraVNA().locateFiles(args.path)
+    cp = crossPolarization()
+    if not cp.compute(files, args.interval, workers=args.workers):
+        return 1
+    if args.out is not None:
+        cp.save(args.out)
+    if args.plot == "avg":
+        cp.plotAvg()
+    elif args.plot is not None:
+        cp.plot2D(args.plot)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""guiLauncher.py:
+Start LibreVNA-GUI as a supervised child process, without a desktop session,
+and wait until its SCPI server answers instead of sleeping a fixed time.
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##########################################################################################
+
+import time
+import shutil
+import threading
+import subprocess
+from libreVNA import libreVNA
+
+
+class guiLauncher():
+
+    def __init__(self, path, port=19542, headless=True, xvfb=False, args=None, log=None,
+                 startTimeout=30, minBackoff=0.05, maxBackoff=1.0):
+        '''
+        headless: start the GUI with --no-gui
+        xvfb: run it under xvfb-run instead (a virtual display, for GUI versions without --no-gui)
+        log: file for the GUI output, discarded if None
+        '''
+        self.path = path
+        self.port = port
+        self.headless = headless
+        self.xvfb = xvfb
+        self.args = args or []
+        self.log = log
+        self.startTimeout = startTimeout
+        self.minBackoff = minBackoff
+        self.maxBackoff = maxBackoff
+        self.proc = None
+        self.restarts = 0
+        self.running = False
+        self.lock = threading.Lock()
+
+    def command(self):
+        cmd = [self.path, "--port", str(self.port)] + self.args
+        if self.xvfb:
+            if shutil.which("xvfb-run") is None:
+                raise Exception("xvfb-run not found, install xvfb or use headless mode")
+            cmd = ["xvfb-run", "-a"] + cmd
+        elif self.headless:
+            cmd.append("--no-gui")
+        return cmd
+
+    def probe(self):
+        '''
+        True if the SCPI server answers *IDN?
+        '''
+        try:
+            vna = libreVNA('localhost', self.port)
+        except Exception:
+            return False
+        try:
+            vna.reader.timeout = 0.5
+            return len(vna.get_id()) > 0
+        except Exception:
+            return False
+        finally:
+            vna.sock.close()
+
+    def waitReady(self):
+        '''
+        Poll the SCPI port with exponential backoff, returns the time until it answered
+        '''
+        t0 = time.time()
+        backoff = self.minBackoff
+        while not self.probe():
+            if self.proc is not None and self.proc.poll() is not None:
+                raise Exception("LibreVNA-GUI exited with code {}".format(self.proc.returncode))
+            if time.time() - t0 > self.startTimeout:
+                raise Exception("LibreVNA-GUI not ready after {} s".format(self.startTimeout))
+            time.sleep(backoff)
+            backoff = min(backoff*2, self.maxBackoff)
+        return time.time() - t0
+
+    def start(self):
+        '''
+        Start the GUI (unless one is already answering on the port) and wait until it is ready
+        '''
+        with self.lock:
+            if self.probe():
+                print("LibreVNA-GUI already running on port", self.port)
+                return 0
+            out = subprocess.DEVNULL if self.log is None else open(self.log, "ab")
+            self.proc = subprocess.Popen(self.command(), stdout=out, stderr=subprocess.STDOUT,
+                                         stdin=subprocess.DEVNULL)
+            if out is not subprocess.DEVNULL:
+                out.close()
+            t = self.waitReady()
+            print("LibreVNA-GUI ready in {:.2f} s".format(t))
+            return t
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def supervise(self, period=1.0):
+        '''
+        Restart the GUI from a background thread if the process dies
+        '''
+        self.running = True
+
+        def loop():
+            while self.running:
+                time.sleep(period)
+                if self.running and self.proc is not None and not self.alive():
+                    print("LibreVNA-GUI exited with code {}, restarting".format(self.proc.returncode))
+                    self.restarts += 1
+                    try:
+                        self.start()
+                    except Exception as e:
+                        print(e)
+
+        threading.Thread(target=loop, daemon=True).start()
+
+    def stop(self, timeout=5):
+        self.running = False
+        if self.alive():
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
@@ -3,7 +3,12 @@ from asyncio import IncompleteReadError  # only import the exception class
 import time
 from signal import signal, alarm, SIGALRM
 from os.path import exists
-from numpy import asarray
+from numpy import asarray, array, ascontiguousarray, empty, stack
+#saSweep, vnaSweep are defined in records.py, kept importable from here
+from records import saSweep, vnaSweep
+
+class GUITimeoutError(Exception):
+    pass
 
 class SocketStreamReader:
     def __init__(self, sock: socket.socket):
@@ -44,7 +49,7 @@ class SocketStreamReader:
             if idx != -1:
                 break
             elif time.time() > timeout:
-                raise Exception("Timed out waiting for response from GUI")
+                raise GUITimeoutError("Timed out waiting for response from GUI")
 
             start = len(self._recv_buffer)
             bytes_read = self._recv_into(memoryview(chunk))
@@ -72,7 +77,27 @@ class libreVNA():
 
     cmd0 = "**LST?"
 
+    #settings kept in the client side cache, query -> setter command
+    cached = {
+        ":SA:FREQ:START?": ":SA:FREQ:START",
+        ":SA:FREQ:STOP?": ":SA:FREQ:STOP",
+        ":SA:ACQ:RBW?": ":SA:ACQ:RBW",
+        ":SA:ACQ:WIND?": ":SA:ACQ:WIND",
+        ":SA:ACQ:DET?": ":SA:ACQ:DET",
+        ":SA:ACQ:AVG?": ":SA:ACQ:AVG",
+        ":SA:ACQ:SIG?": ":SA:ACQ:SIG",
+        ":VNA:FREQ:START?": ":VNA:FREQ:START",
+        ":VNA:FREQ:STOP?": ":VNA:FREQ:STOP",
+        ":VNA:ACQ:POINTS?": ":VNA:ACQ:POINTS",
+        ":VNA:ACQ:IFBW?": ":VNA:ACQ:IFBW",
+        ":VNA:STIM:LVL?": ":VNA:STIM:LVL",
+        ":VNA:ACQ:AVG?": ":VNA:ACQ:AVG",
+    }
+
     def __init__(self, host='localhost', port=19542):
+        self.state = {}     #last confirmed value of the cached settings
+        self.metrics = None     #metrics.metrics instance to instrument the commands
+        self.sweepTime = None   #running estimate of the single sweep duration (s)
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
             self.sock.connect((host, port))
@@ -84,19 +109,74 @@ class libreVNA():
         self.sock.close()
 
     def __read_response(self):
-        return self.reader.readline().decode().rstrip()
+        line = self.reader.readline()
+        if self.metrics is not None:
+            self.metrics.inc("bytes_received_total", len(line))
+        return line.decode().rstrip()
+
+    def __observe(self, kind, command, t0):
+        self.metrics.observe("scpi_latency_seconds", time.perf_counter()-t0, kind=kind, command=command.split(" ")[0])
 
     def cmd(self, cmd):
+        if self.metrics is not None:
+            t0 = time.perf_counter()
         self.sock.sendall(cmd.encode())
         self.sock.send(b"\n")
         resp = self.__read_response()
+        if self.metrics is not None:
+            self.__observe("cmd", cmd, t0)
         if len(resp) > 0:
         	raise Exception("Expected empty response but got "+resp)
         
     def query(self, query):
+        if self.metrics is not None:
+            t0 = time.perf_counter()
         self.sock.sendall(query.encode())
         self.sock.send(b"\n")
-        return self.__read_response()
+        resp = self.__read_response()
+        if self.metrics is not None:
+            self.__observe("query", query, t0)
+        return resp
+
+    def query_batch(self, queries):
+        '''
+        Send all the queries at once and read the answers in order, one round trip
+        '''
+        if len(queries) == 0:
+            return []
+        if self.metrics is not None:
+            t0 = time.perf_counter()
+        self.sock.sendall(("\n".join(queries)+"\n").encode())
+        resps = [self.__read_response() for q in queries]
+        if self.metrics is not None:
+            self.__observe("batch", "BATCH", t0)
+        return resps
+
+    def cmd_batch(self, cmds):
+        resps = self.query_batch(cmds)
+        for resp in resps:
+            if len(resp) > 0:
+                raise Exception("Expected empty response but got "+resp)
+
+    def cached_query(self, query):
+        if query not in self.state:
+            self.state[query] = self.query(query)
+        return self.state[query]
+
+    def read_state(self, queries=None):
+        '''
+        Refresh the cache of the given settings queries (all the cached ones if None)
+        with a single batched query, e.g. read_state(config.values())
+        '''
+        queries = list(self.cached if queries is None else queries)
+        self.state.update(zip(queries, self.query_batch(queries)))
+        return dict(self.state)
+
+    def invalidate(self, *queries):
+        if len(queries) == 0:
+            self.state.clear()
+        for q in queries:
+            self.state.pop(q, None)
     
     @staticmethod
     def parse_VNA_trace_data(data):
@@ -113,6 +193,29 @@ class libreVNA():
             imag = float(values[i+2])
             ret.append((freq, complex(real, imag)))
         return ret
+
+    @staticmethod
+    def parse_VNA_trace_array(data):
+        '''
+        Vectorized parse_VNA_trace_data(), returns frequency and complex128 arrays
+        '''
+        values = array(data.replace(']','').replace('[','').split(','), dtype=float)
+        if len(values) % 3 != 0:
+            raise Exception("Invalid input data: expected tuples of three values each")
+        values = values.reshape(-1, 3)
+        c = ascontiguousarray(values[:, 1:]).view(complex).ravel()
+        return values[:, 0].copy(), c
+
+    @staticmethod
+    def parse_SA_trace_array(data):
+        '''
+        Vectorized parse_SA_trace_data(), returns frequency and dBm arrays
+        '''
+        values = array(data.replace(']','').replace('[','').split(','), dtype=float)
+        if len(values) % 2 != 0:
+            raise Exception("Invalid input data: expected tuples of two values each")
+        values = values.reshape(-1, 2)
+        return values[:, 0].copy(), values[:, 1].copy()
     
     @staticmethod
     def parse_SA_trace_data(data):
@@ -178,6 +281,7 @@ class libreVNA():
     def connect(self, dev=""):
         cmd = ":DEV:CONN "+ dev
         self.cmd(cmd)
+        self.invalidate()
         time.sleep(0.2)
         dev = self.query(":DEV:CONN?")
         if dev == "Not connected":
@@ -206,6 +310,7 @@ class libreVNA():
 
         cmd = ":DEV:MODE "+ mod
         self.cmd(cmd)
+        self.invalidate()
         time.sleep(0.2)
         ans = self.query(":DEV:MODE?")
         if ans != mod:
@@ -232,6 +337,7 @@ class libreVNA():
         if not exists(file):
             print("Setup file {} doesn't exist".format(file))
             return 0
+        self.invalidate()
         return self.query(":DEV:SETUP:LOAD? "+file)
 
 
@@ -296,6 +402,13 @@ class libreVNA():
         temps = t.split("/")
         return float(temps[2])
 
+    def get_temps(self):
+        '''
+        Source, LO and CPU temperatures from a single query
+        '''
+        t = self.query(":DEV:INF:TEMP?")
+        return [float(x) for x in t.split("/")]
+
 
     def get_fullInfo(self):
         print("Libre VNA")
@@ -330,13 +443,239 @@ class libreVNA():
 
         print("Maximum harmonic                 : {:.2f} MHz".format(float(self.query(":DEV:INF:LIM:MAXHARM?"))/1000000 ))
 
+
+    def get_limits(self):
+        '''
+        Device limits as numbers, frequencies and RBW in Hz
+        '''
+        return {
+            "minF": float(self.query(":DEV:INF:LIM:MINF?")),
+            "maxF": float(self.query(":DEV:INF:LIM:MAXF?")),
+            "maxPoints": int(self.query(":DEV:INF:LIM:MAXP?")),
+            "minRBW": float(self.query(":DEV:INF:LIM:MINRBW?")),
+            "maxRBW": float(self.query(":DEV:INF:LIM:MAXRBW?")),
+        }
+
     #####################################################################################
     #####################################################################################
     #                                VNA COMMANDS
     #####################################################################################
     #####################################################################################
 
-    #in progress...
+    def set_vnaStart(self, freq):
+        '''
+        Start frequency in MHz
+        '''
+        freq *= 1000000
+        cmd = ":VNA:FREQ:START "+ str(int(freq))
+        self.cmd(cmd)
+        time.sleep(0.2)
+        ans = self.query(":VNA:FREQ:START?")
+        if float(ans) != freq:
+            self.invalidate(":VNA:FREQ:START?")
+            print("Failed to set start frequency")
+            return 0
+        else:
+            self.state[":VNA:FREQ:START?"] = ans
+            print("Start frequency set to: {:.3f} MHz".format(freq/1000000))
+            return 1
+
+    def get_vnaStart(self):
+        return self.cached_query(":VNA:FREQ:START?")
+
+
+    def set_vnaStop(self, freq):
+        '''
+        Stop frequency in MHz
+        '''
+        freq *= 1000000
+        cmd = ":VNA:FREQ:STOP "+ str(int(freq))
+        self.cmd(cmd)
+        time.sleep(0.2)
+        ans = self.query(":VNA:FREQ:STOP?")
+        if float(ans) != freq:
+            self.invalidate(":VNA:FREQ:STOP?")
+            print("Failed to set stop frequency")
+            return 0
+        else:
+            self.state[":VNA:FREQ:STOP?"] = ans
+            print("Stop frequency set to: {:.3f} MHz".format(freq/1000000))
+            return 1
+
+    def get_vnaStop(self):
+        return self.cached_query(":VNA:FREQ:STOP?")
+
+
+    def set_vnaPoints(self, points=501):
+        cmd = ":VNA:ACQ:POINTS "+ str(int(points))
+        self.cmd(cmd)
+        time.sleep(0.2)
+        ans = self.query(":VNA:ACQ:POINTS?")
+        if float(ans) != points:
+            self.invalidate(":VNA:ACQ:POINTS?")
+            print("Failed to set the number of points")
+            return 0
+        else:
+            self.state[":VNA:ACQ:POINTS?"] = ans
+            print("Points set to: {}".format(ans))
+            return 1
+
+    def get_vnaPoints(self):
+        return int(self.cached_query(":VNA:ACQ:POINTS?"))
+
+
+    def set_vnaIFBW(self, freq):
+        '''
+        IF bandwidth in KHz
+        '''
+        freq *= 1000
+        cmd = ":VNA:ACQ:IFBW "+ str(freq)
+        self.cmd(cmd)
+        time.sleep(0.2)
+        ans = self.query(":VNA:ACQ:IFBW?")
+        if float(ans) != freq:
+            self.invalidate(":VNA:ACQ:IFBW?")
+            print("Failed to set IF bandwidth")
+            return 0
+        else:
+            self.state[":VNA:ACQ:IFBW?"] = ans
+            print("IF bandwidth set to: {:.3f} KHz".format(freq/1000))
+            return 1
+
+    def get_vnaIFBW(self):
+        return self.cached_query(":VNA:ACQ:IFBW?")
+
+
+    def set_vnaPower(self, level=-10):
+        '''
+        Stimulus level in dBm
+        '''
+        cmd = ":VNA:STIM:LVL "+ str(level)
+        self.cmd(cmd)
+        time.sleep(0.2)
+        ans = self.query(":VNA:STIM:LVL?")
+        if float(ans) != level:
+            self.invalidate(":VNA:STIM:LVL?")
+            print("Failed to set stimulus level")
+            return 0
+        else:
+            self.state[":VNA:STIM:LVL?"] = ans
+            print("Stimulus level set to: {} dBm".format(ans))
+            return 1
+
+    def get_vnaPower(self):
+        return self.cached_query(":VNA:STIM:LVL?")
+
+
+    def set_vnaAvgNumber(self, avg=1, msg=True):
+        cmd = ":VNA:ACQ:AVG "+ str(int(avg))
+        self.cmd(cmd)
+        time.sleep(0.2)
+        ans = self.query(":VNA:ACQ:AVG?")
+        if float(ans) != avg:
+            self.invalidate(":VNA:ACQ:AVG?")
+            if msg:
+                print("Failed to set the average number")
+            return 0
+        else:
+            self.state[":VNA:ACQ:AVG?"] = ans
+            if msg:
+                print("Average trace set to: {:.1f} ".format(avg))
+            return 1
+
+    def get_vnaAvgNumber(self):
+        return self.cached_query(":VNA:ACQ:AVG?")
+
+
+    def get_vnaCurrentAvg(self):
+        return int(self.query(":VNA:ACQ:AVGLEV?"))
+
+
+    def is_vnaAvgDone(self):
+        return self.query(":VNA:ACQ:FIN?") == "TRUE"
+
+
+    def set_vnaSingleSweep(self, st=True):
+        value=None
+        if st:
+            value="TRUE" 
+        else:
+            value="FALSE"
+        return self.query(":VNA:ACQ:SINGLE "+value)
+
+    def get_vnaSingleSweep(self):
+        return self.query(":VNA:ACQ:SINGLE?") == "TRUE"
+
+    #####################################################################################
+
+
+    def get_vnaTraces(self):
+        t = self.query(":VNA:TRAC:LIST?")
+        return t.split(",")
+
+
+    def get_vnaData(self, trace="S11"):
+        '''
+        returns frequency (Hz) and complex128 arrays of one trace
+        '''
+        if isinstance(trace, int):
+            trace = str(trace)
+        return self.parse_VNA_trace_array(self.query(":VNA:TRAC:DATA? "+trace))
+
+
+    def get_vnaAllData(self, traces=None):
+        '''
+        All traces (or the given names) in one batched readout, returns
+        frequency (Hz), trace names and a (ntraces, npoints) complex128 array
+        '''
+        if traces is None:
+            traces = self.get_vnaTraces()
+        answers = self.query_batch([":VNA:TRAC:DATA? "+t for t in traces])
+        if self.metrics is not None:
+            t0 = time.perf_counter()
+        freq = None
+        S = None
+        for i, data in enumerate(answers):
+            f, c = self.parse_VNA_trace_array(data)
+            if S is None:
+                freq = f
+                S = empty((len(traces), len(c)), dtype=complex)
+            S[i] = c
+        if self.metrics is not None:
+            self.metrics.observe("parse_seconds", time.perf_counter()-t0, trace="VNA")
+        return freq, list(traces), S
+
+    def get_vnaSweep(self, traces=None):
+        freq, names, S = self.get_vnaAllData(traces)
+        return vnaSweep(time.time(), freq, names, S)
+
+    def expected_vnaSweepTime(self):
+        '''
+        Conservative duration (s) of an averaged sweep with the current settings,
+        navg sweeps of points measured in up to 2/IFBW s each. None if unknown
+        '''
+        try:
+            points = float(self.cached_query(":VNA:ACQ:POINTS?"))
+            ifbw = float(self.cached_query(":VNA:ACQ:IFBW?"))
+            navg = float(self.cached_query(":VNA:ACQ:AVG?"))
+        except ValueError:
+            return None
+        if ifbw <= 0:
+            return None
+        return max(navg, 1)*(1 + 2*points/ifbw)
+
+    def acquire_vnaSweep(self, traces=None, timeout=None, minPoll=0.005, maxPoll=0.2):
+        '''
+        VNA counterpart of acquire_sweep: trigger one single (averaged) sweep, wait for it
+        and read the traces in one batched readout, so they all come from that sweep.
+        Returns a vnaSweep stamped at the end of the sweep.
+        timeout: seconds, by default 5 times the expected sweep time (at least 10 s)
+        '''
+        timestamp, elapsed = self.__wait_sweep("VNA", self.expected_vnaSweepTime(), timeout, minPoll, maxPoll)
+        freq, names, S = self.get_vnaAllData(traces)
+        if self.metrics is not None:
+            self.metrics.observe("sweep_seconds", elapsed)
+        return vnaSweep(timestamp, freq, names, S)
 
     #####################################################################################
     #####################################################################################
@@ -352,6 +691,7 @@ class libreVNA():
         '''
         span *= 1000000
         cmd = ":SA:FREQ:SPAN "+ str(span)
+        self.invalidate(":SA:FREQ:START?", ":SA:FREQ:STOP?")
         self.cmd(cmd)
         time.sleep(0.2)
         ans = self.query(":SA:FREQ:SPAN?")
@@ -378,14 +718,16 @@ class libreVNA():
         time.sleep(0.2)
         ans = self.query(":SA:FREQ:START?")
         if float(ans) != freq:
+            self.invalidate(":SA:FREQ:START?")
             print("Failed to set start frequency")
             return 0
         else:
+            self.state[":SA:FREQ:START?"] = ans
             print("Start frequency set to: {:.3f} MHz".format(freq/1000000))
             return 1
         
     def get_saStart(self):
-        return self.query(":SA:FREQ:START?")
+        return self.cached_query(":SA:FREQ:START?")
     
 
     def set_saCenter(self, freq):
@@ -394,6 +736,7 @@ class libreVNA():
         '''
         freq *= 1000000
         cmd = ":SA:FREQ:CENT "+ str(freq)
+        self.invalidate(":SA:FREQ:START?", ":SA:FREQ:STOP?")
         self.cmd(cmd)
         time.sleep(0.2)
         ans = self.query(":SA:FREQ:CENT?")
@@ -418,20 +761,24 @@ class libreVNA():
         time.sleep(0.2)
         ans = self.query(":SA:FREQ:STOP?")
         if float(ans) != freq:
+            self.invalidate(":SA:FREQ:STOP?")
             print("Failed to set stop frequency")
             return 0
         else:
+            self.state[":SA:FREQ:STOP?"] = ans
             print("Stop frequency set to: {:.3f} MHz".format(freq/1000000))
             return 1
         
     def get_saStop(self):
-        return self.query(":SA:FREQ:STOP?")
+        return self.cached_query(":SA:FREQ:STOP?")
 
 
     def set_saFullRange(self):
+        self.invalidate(":SA:FREQ:START?", ":SA:FREQ:STOP?")
         return self.query(":SA:FREQ:FULL")
 
     def set_saNullRange(self):
+        self.invalidate(":SA:FREQ:START?", ":SA:FREQ:STOP?")
         return self.query(":SA:FREQ:ZERO")
         
     #####################################################################################
@@ -447,72 +794,80 @@ class libreVNA():
         time.sleep(0.2)
         ans = self.query(":SA:ACQ:RBW?")
         if float(ans) != freq:
+            self.invalidate(":SA:ACQ:RBW?")
             print("Failed to set resolution bandwidth")
             return 0
         else:
+            self.state[":SA:ACQ:RBW?"] = ans
             print("Resolution bandwidth set to: {:.3f} KHz".format(freq/1000))
             return 1
         
     def get_saRBW(self):
-        return self.query(":SA:ACQ:RBW?")
+        return self.cached_query(":SA:ACQ:RBW?")
 
 
-    def set_saWindow(self,window=None):
-        w = None
-  
+    @staticmethod
+    def windowName(window=None):
         if window in ["KAISER", "kaiser"]:
-            w = "KAISER"
+            return "KAISER"
         elif window in ["HANN", "hann", "hanning", "HANNING"]:
-            w = "HANN"
+            return "HANN"
         elif window in ["FLATTOP", "flattop", "flatTop"]:
-            w = "FLATTOP"
+            return "FLATTOP"
         else:
-            w="NONE"
+            return "NONE"
+
+    def set_saWindow(self,window=None):
+        w = self.windowName(window)
         
         cmd = ":SA:ACQ:WIND "+ w
         self.cmd(cmd)
         time.sleep(0.2)
         ans = self.query(":SA:ACQ:WIND?")
         if ans != w:
+            self.invalidate(":SA:ACQ:WIND?")
             print("Failed to set window")
             return 0
         else:
+            self.state[":SA:ACQ:WIND?"] = ans
             print("Window set to: "+ans)
             return 1
         
     def get_saWindow(self):
-        return self.query(":SA:ACQ:WIND?")
+        return self.cached_query(":SA:ACQ:WIND?")
 
 
-    def set_saDetector(self,detector=None):
-        d = None
-  
+    @staticmethod
+    def detectorName(detector=None):
         if detector in ["+PEAK", "+peak", "PEAK+", "peak+"]:
-            d = "+PEAK"
+            return "+PEAK"
         elif detector in ["-PEAK", "-peak", "PEAK-", "peak-"]:
-            d = "-PEAK"
-        elif detector in ["NORMAL", "normal"]:
-            d = "NORMAL"
+            return "-PEAK"
         elif detector in ["SAMPLE", "sample"]:
-            d = "SAMPLE"
+            return "SAMPLE"
         elif detector in ["AVERAGE", "average", "AVG", "avg"]:
-            d = "AVERAGE"
+            return "AVERAGE"
         else:
-            d="NORMAL"
+            return "NORMAL"
+
+    def set_saDetector(self,detector=None):
+        d = self.detectorName(detector)
         
         cmd = ":SA:ACQ:DET "+ d
         self.cmd(cmd)
         time.sleep(0.2)
         ans = self.query(":SA:ACQ:DET?")
         if ans != d:
+            self.invalidate(":SA:ACQ:DET?")
             print("Failed to set detector type")
             return 0
         else:
+            self.state[":SA:ACQ:DET?"] = ans
             print("Detector set to: "+ans)
             return 1
         
     def get_saDetector(self):
-        return self.query(":SA:ACQ:DET?")
+        return self.cached_query(":SA:ACQ:DET?")
 
 
     def set_saAvgNumber(self,avg=1, msg=True):
@@ -521,16 +876,18 @@ class libreVNA():
         time.sleep(0.2)
         ans = self.query(":SA:ACQ:AVG?")
         if float(ans) != avg:
+            self.invalidate(":SA:ACQ:AVG?")
             if msg:
                 print("Failed to set the average number")
             return 0
         else:
+            self.state[":SA:ACQ:AVG?"] = ans
             if msg:
                 print("Average trace set to: {:.1f} ".format(avg))
             return 1
         
     def get_saAvgNumber(self):
-        return self.query(":SA:ACQ:AVG?")
+        return self.cached_query(":SA:ACQ:AVG?")
 
 
     def get_saCurrentAvg(self):
@@ -538,7 +895,7 @@ class libreVNA():
 
 
     def is_saAvgDone(self):
-        return bool(self.query(":SA:ACQ:FIN?"))
+        return self.query(":SA:ACQ:FIN?") == "TRUE"
 
 
     def is_saLimit(self):
@@ -558,7 +915,7 @@ class libreVNA():
         return self.query(":SA:ACQ:SINGLE "+value)
 
     def get_saSingleSweep(self):
-        return bool(self.query(":SA:ACQ:SINGLE?"))
+        return self.query(":SA:ACQ:SINGLE?") == "TRUE"
 
 
     def set_saSignalID(self, st=True):
@@ -567,10 +924,11 @@ class libreVNA():
             value="TRUE" 
         else:
             value="FALSE"
+        self.invalidate(":SA:ACQ:SIG?")
         return self.query(":SA:ACQ:SIG "+value)
 
     def get_saSignalID(self):
-        return bool(self.query(":SA:ACQ:SIG?"))
+        return self.cached_query(":SA:ACQ:SIG?") == "TRUE"
 
     #####################################################################################
 
@@ -659,12 +1017,92 @@ class libreVNA():
             print("Invalid port selected  <1 , 2>")
             return False
         data = self.query(":SA:TRAC:DATA? "+val)
+        if self.metrics is not None:
+            t0 = time.perf_counter()
         data = data.replace("[", "").replace("]", "")
         b = data.split(",")
         c = []
         for i in range(len(b)//2):
             c.append([float(b[i*2]), float(b[i*2 +1])])
-        return asarray(c).T
+        c = asarray(c).T
+        if self.metrics is not None:
+            self.metrics.observe("parse_seconds", time.perf_counter()-t0, trace=val)
+        return c
+
+    def expected_saSweepTime(self):
+        '''
+        Conservative duration (s) of an averaged sweep with the current settings,
+        navg sweeps of span/RBW bins of up to 10/RBW s each. None if unknown
+        '''
+        try:
+            span = float(self.cached_query(":SA:FREQ:STOP?")) - float(self.cached_query(":SA:FREQ:START?"))
+            rbw = float(self.cached_query(":SA:ACQ:RBW?"))
+            navg = float(self.cached_query(":SA:ACQ:AVG?"))
+        except ValueError:
+            return None
+        if rbw <= 0:
+            return None
+        return max(navg, 1)*(1 + span/rbw*10/rbw)
+
+    def __wait_sweep(self, mode, bound, timeout, minPoll, maxPoll):
+        '''
+        Trigger one single sweep of mode ("SA" or "VNA") and wait for it, polling
+        from near the running sweep time estimate with a geometric backoff.
+        bound: expected duration from the settings, used before the first measured sweep
+        returns the end timestamp and the elapsed seconds
+        '''
+        t0 = time.time()
+        self.cmd(":"+mode+":ACQ:SINGLE TRUE")
+        expected = self.sweepTime
+        if timeout is None:
+            #before the first measured sweep, from the settings
+            if expected is not None:
+                bound = expected
+            timeout = 10 if bound is None else max(10, 5*bound)
+        limit = t0 + timeout
+        if expected is not None:
+            time.sleep(0.8*expected)
+        poll = minPoll
+        polls = 0
+        while self.query(":"+mode+":ACQ:FIN?") != "TRUE":
+            if time.time() > limit:
+                raise GUITimeoutError("Timed out waiting for the sweep to finish")
+            time.sleep(poll)
+            poll = min(poll*1.5, maxPoll)
+            polls += 1
+        timestamp = time.time()
+        elapsed = timestamp - t0
+        if expected is None:
+            self.sweepTime = elapsed
+        elif polls == 0:
+            #already finished at the first check, the estimate may be too long
+            self.sweepTime = 0.9*expected
+        else:
+            self.sweepTime = 0.7*expected + 0.3*elapsed
+        return timestamp, elapsed
+
+    def acquire_sweep(self, timeout=None, minPoll=0.005, maxPoll=0.2):
+        '''
+        Trigger one single sweep (averaged over the configured navg), wait for it
+        and read both ports and the temperatures in one batched readout.
+        Polling starts near the expected sweep time and backs off geometrically.
+        Returns a saSweep stamped at the end of the sweep.
+        timeout: seconds, by default 5 times the expected sweep time (at least 10 s)
+        '''
+        timestamp, elapsed = self.__wait_sweep("SA", self.expected_saSweepTime(), timeout, minPoll, maxPoll)
+
+        p1, p2, t = self.query_batch([":SA:TRAC:DATA? PORT1", ":SA:TRAC:DATA? PORT2", ":DEV:INF:TEMP?"])
+        if self.metrics is not None:
+            t1 = time.perf_counter()
+        freq, dBm1 = self.parse_SA_trace_array(p1)
+        freq2, dBm2 = self.parse_SA_trace_array(p2)
+        if len(dBm1) != len(dBm2):
+            raise Exception("Port traces with different number of points")
+        if self.metrics is not None:
+            self.metrics.observe("parse_seconds", time.perf_counter()-t1, trace="SWEEP")
+            self.metrics.observe("sweep_seconds", elapsed)
+        temps = [float(x) for x in t.split("/")]
+        return saSweep(timestamp, freq, stack((dBm1, dBm2), axis=-1), temps[1], temps[2])
 
     def get_saPower(self,trace, freq): #in KHz
         freq *=1000
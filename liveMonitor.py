@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+"""liveMonitor.py:
+Live waterfall and average spectrum following the newest spc_*.h5 file
+(written with saRecorder(swmr=True)) or the recorder's sweeps through a queue.
+Only the new sweeps are read and each frame costs the same however long
+the station has been recording.
+
+    python3 liveMonitor.py /path/to/out --port 1 --depth 600 --fps 5
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##############################################################################################
+
+import os
+import time
+import queue
+import argparse
+import numpy as np
+import h5py
+
+
+class fileFollower():
+    '''
+    New sweeps (timestamp, freq, dBm (n, 2)) of the newest file in path.
+    Listing the directory grows with the archive, so a newer file is looked for
+    every rescan seconds, or every rescan/10 once the current file is full
+    '''
+
+    def __init__(self, path, prefix="spc_", rescan=2.0):
+        self.path = path
+        self.prefix = prefix
+        self.rescan = rescan
+        self.filename = None
+        self.f = None
+        self.rows = 0
+        self.full = False
+        self.lastScan = None
+
+    def newest(self):
+        files = [f for f in os.listdir(self.path) if f.startswith(self.prefix) and f.endswith(".h5")]
+        return os.path.join(self.path, max(files)) if files else None
+
+    def open(self, filename):
+        self.close()
+        try:
+            self.f = h5py.File(filename, 'r', libver='latest', swmr=True)
+        except OSError:
+            #written without SWMR, only readable once closed
+            self.f = h5py.File(filename, 'r')
+        self.filename = filename
+        self.rows = 0
+        self.full = False
+
+    def validRows(self):
+        t = self.f["/Data/datetime"]
+        if hasattr(t, "refresh") and self.f.swmr_mode:
+            t.refresh()
+        t = t[:]
+        return int(np.count_nonzero(t > 0))
+
+    def readNew(self):
+        n = self.validRows()
+        if n <= self.rows:
+            return []
+        d = self.f["/Data/dBm"]
+        if self.f.swmr_mode:
+            d.refresh()
+        t = self.f["/Data/datetime"][self.rows:n]
+        dBm = d[self.rows:n]
+        freq = self.f["/Data/frequency"][:]
+        self.rows = n
+        self.full = n >= len(d)
+        return [(ti, freq, di) for ti, di in zip(t, dBm)]
+
+    def poll(self):
+        now = time.monotonic()
+        period = self.rescan/10 if self.full else self.rescan
+        if self.f is None or now - self.lastScan >= period:
+            newest = self.newest()
+            self.lastScan = now
+            if newest is None:
+                return []
+        else:
+            newest = self.filename
+        out = []
+        try:
+            if self.f is None:
+                self.open(newest)
+            out += self.readNew()
+            if newest != self.filename:
+                #rotated: the rows left in the previous file, then the new one
+                self.open(newest)
+                out += self.readNew()
+        except (OSError, KeyError) as e:
+            #file still being created
+            print(e)
+            self.close()
+        return out
+
+    def close(self):
+        if self.f is not None:
+            try:
+                self.f.close()
+            except Exception:
+                pass
+            self.f = None
+
+
+class queueFollower():
+    '''
+    Sweeps pushed by the recorder, e.g. recorder.listeners.append(follower.put)
+    '''
+
+    def __init__(self, maxsize=1000):
+        self.queue = queue.Queue(maxsize)
+
+    def put(self, sweep):
+        try:
+            self.queue.put_nowait((sweep.timestamp, sweep.freq, sweep.dBm))
+        except queue.Full:
+            pass
+
+    def poll(self):
+        out = []
+        while True:
+            try:
+                out.append(self.queue.get_nowait())
+            except queue.Empty:
+                return out
+
+
+class liveMonitor():
+
+    def __init__(self, source, depth=600, port=1, mindB=-100, maxdB=-20):
+        '''
+        source: fileFollower or queueFollower, depth: sweeps shown in the waterfall
+        '''
+        self.source = source
+        self.depth = depth
+        self.port = port
+        self.mindB = mindB
+        self.maxdB = maxdB
+        self.freq = None
+        self.ring = None
+        self.times = None
+        self.head = 0
+        self.count = 0
+        self.sum = None
+        self.fig = None
+
+    def reset(self, freq):
+        n = len(freq)
+        self.freq = np.asarray(freq)
+        self.ring = np.full((self.depth, n), np.nan, dtype=np.float32)
+        self.times = np.zeros(self.depth)
+        self.sum = np.zeros(n)
+        self.head = 0
+        self.count = 0
+
+    def push(self, timestamp, freq, dBm):
+        '''
+        Add one sweep, the average spectrum is updated with a running sum
+        '''
+        if self.freq is None or len(freq) != len(self.freq) or not np.array_equal(freq, self.freq):
+            self.reset(freq)
+        row = dBm[:, self.port-1] if np.ndim(dBm) > 1 else dBm
+        if self.count == self.depth:
+            self.sum -= self.ring[self.head]
+        else:
+            self.count += 1
+        self.ring[self.head] = row
+        self.sum += row
+        self.times[self.head] = timestamp
+        self.head = (self.head + 1) % self.depth
+
+    def update(self):
+        '''
+        Pull the new sweeps, returns how many were added
+        '''
+        sweeps = self.source.poll()
+        for s in sweeps:
+            self.push(*s)
+        return len(sweeps)
+
+    def waterfall(self):
+        '''
+        Ring buffer ordered newest sweep first
+        '''
+        idx = (self.head - 1 - np.arange(self.depth)) % self.depth
+        return self.ring[idx]
+
+    def average(self):
+        return self.sum/max(self.count, 1)
+
+    def show(self, fps=5):
+        from matplotlib import pyplot  as plt
+        from matplotlib.animation import FuncAnimation
+
+        while self.freq is None:
+            self.update()
+            plt.pause(0.5)
+
+        x = self.freq/1000000  #To MHz
+        self.fig, (ax1, ax2) = plt.subplots(2, 1, sharex=True, num=5, gridspec_kw={"height_ratios": [3, 1]})
+        im = ax1.imshow(self.waterfall(), aspect="auto", cmap="jet", vmin=self.mindB, vmax=self.maxdB,
+                        extent=(x[0], x[-1], self.depth, 0), interpolation="nearest", animated=True)
+        self.fig.colorbar(im, ax=[ax1, ax2], shrink=0.5, aspect=5)
+        ax1.set_ylabel("sweeps ago")
+        ax1.set_title('Live RFI port {}'.format(self.port))
+        line, = ax2.plot(x, self.average(), animated=True)
+        ax2.set_ylim(self.mindB, self.maxdB)
+        ax2.set_xlabel("MHz")
+        ax2.set_ylabel("dBm")
+        ax2.grid()
+
+        def frame(i):
+            if self.update() > 0:
+                im.set_data(self.waterfall())
+                line.set_ydata(self.average())
+            return im, line
+
+        self.anim = FuncAnimation(self.fig, frame, interval=1000/fps, blit=True, cache_frame_data=False)
+        plt.show()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Live RFI waterfall of the growing archive")
+    parser.add_argument("path", help="directory where autoSA.py writes the spc_*.h5 files")
+    parser.add_argument("--port", type=int, default=1, choices=[1, 2])
+    parser.add_argument("--depth", type=int, default=600, help="sweeps in the waterfall")
+    parser.add_argument("--fps", type=float, default=5)
+    parser.add_argument("--min", type=float, default=-100)
+    parser.add_argument("--max", type=float, default=-20)
+    args = parser.parse_args(argv)
+
+    mon = liveMonitor(fileFollower(args.path), args.depth, args.port, args.min, args.max)
+    mon.show(args.fps)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
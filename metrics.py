@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""metrics.py:
+Latency histograms and counters for the acquisition hot path, exported in
+Prometheus text format over HTTP and/or to a file.
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##########################################################################################
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#seconds, from 100 us to 30 s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class histogram():
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0]*(len(buckets)+1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class metrics():
+    '''
+    Keep one instance and assign it to libreVNA.metrics / saRecorder.metrics,
+    with the attribute left as None nothing is measured
+    '''
+
+    def __init__(self, prefix="librevna_"):
+        self.prefix = prefix
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.running = False
+
+    @staticmethod
+    def key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def observe(self, name, value, **labels):
+        k = self.key(name, labels)
+        with self.lock:
+            h = self.histograms.get(k)
+            if h is None:
+                h = self.histograms[k] = histogram()
+            h.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        k = self.key(name, labels)
+        with self.lock:
+            self.counters[k] = self.counters.get(k, 0) + value
+
+    @staticmethod
+    def labelText(labels, extra=None):
+        items = list(labels) + ([extra] if extra else [])
+        if len(items) == 0:
+            return ""
+        return "{" + ",".join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in items) + "}"
+
+    def render(self):
+        '''
+        Prometheus text exposition format
+        '''
+        lines = []
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                name = self.prefix + name
+                if name not in typed:
+                    lines.append("# TYPE {} counter".format(name))
+                    typed.add(name)
+                lines.append("{}{} {}".format(name, self.labelText(labels), value))
+            for (name, labels), h in sorted(self.histograms.items()):
+                name = self.prefix + name
+                if name not in typed:
+                    lines.append("# TYPE {} histogram".format(name))
+                    typed.add(name)
+                total = 0
+                for le, n in zip(h.buckets, h.counts):
+                    total += n
+                    lines.append("{}_bucket{} {}".format(name, self.labelText(labels, ("le", le)), total))
+                lines.append("{}_bucket{} {}".format(name, self.labelText(labels, ("le", "+Inf")), h.count))
+                lines.append("{}_sum{} {}".format(name, self.labelText(labels), h.sum))
+                lines.append("{}_count{} {}".format(name, self.labelText(labels), h.count))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9105, host="localhost"):
+        '''
+        Expose the metrics on http://host:port/metrics from a background thread
+        '''
+        registry = self
+
+        class handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address[1]
+
+    def dump(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def dumpEvery(self, path, period=10):
+        '''
+        Rewrite the metrics file every period seconds from a background thread
+        '''
+        self.running = True
+
+        def loop():
+            while self.running:
+                time.sleep(period)
+                self.dump(path)
+
+        threading.Thread(target=loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
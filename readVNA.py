@@ -8,12 +8,12 @@ __email__   = "japaza@igp.gob.pe"
 ##############################################################################################
 import numpy as np
 import h5py 
-from matplotlib import pyplot  as plt
 import os 
-from matplotlib import cm
-from matplotlib.ticker import LinearLocator, FormatStrFormatter
-from mpl_toolkits.mplot3d import Axes3D
+import argparse
 from datetime import datetime
+from regrid import axisHash, regrid as regridSpectra
+from records import saSweep
+#matplotlib is imported inside the plot methods, loading data does not need it
 
 
 class spectraVNA():
@@ -34,6 +34,7 @@ class spectraVNA():
         self.detector = None
         self.avg = 1
         self.window = "None"
+        self.axisGroups = {}    #frequency axis hash -> files, filled by getData
 
     @property
     def span(self):
@@ -48,40 +49,103 @@ class spectraVNA():
                 fileList.append(os.path.join(path,file))
         return fileList
 
-    def getData(self, files, port=1):
-         
+    def getData(self, files, port=1, regrid=None, target=None):
+        '''
+        regrid: None to load only the files with the frequency axis of the first one,
+        "interp" or "bin" to bring every file to the target axis (Hz, the first file's if None)
+        Files with one axis per record (Data/frequencies, revisit sweeps) are split by axis
+        '''
+        targetHash = None if target is None else axisHash(target)
         for file in files:
             try:
                 with  h5py.File(file, 'r') as f:
                     dBm =  f.get("/Data/dBm")[:]
-                    
-                    if self.empty:
-                        #dBm =  f.get("/Data/dBm")[:] 
-                        self.dBm = dBm[:,:,port-1] if len(dBm.shape)>2  else  dBm[:]
-                        self.freq =  f.get("/Data/frequency")[:]
-                        self.dateTime = f.get("/Data/datetime")[:]
-                        self.cpuTemp = f.get("/Data/CPUtemperature")[:]
-                        self.loTemp = f.get("/Data/LOtemperature")[:]
-                        #get the SA Metadata...
-                        self.rbdw = f.get("/MetaData").attrs['Resolution Frequency']
-                        self.start = f.get("/MetaData").attrs['Start Frequency']
-                        self.stop = f.get("/MetaData").attrs['Stop Frequency']
-                        self.detector = f.get("/MetaData").attrs['detector']
-                        self.navg = f.get("/MetaData").attrs['navg']
-                        self.window = f.get("/MetaData").attrs['window']
-                        self.empty = False
+                    dBm = dBm[:,:,port-1] if len(dBm.shape)>2  else  dBm[:]
+                    dateTime = f.get("/Data/datetime")[:]
+                    cpuTemp = f.get("/Data/CPUtemperature")[:]
+                    loTemp = f.get("/Data/LOtemperature")[:]
+                    meta = dict(f.get("/MetaData").attrs)
+                    if "frequencies" in f["Data"]:
+                        rows = np.nonzero(dateTime > 0)[0]
+                        axes, inverse = np.unique(f.get("/Data/frequencies")[:][rows], axis=0, return_inverse=True)
+                        inverse = inverse.reshape(-1)
+                        #runs of consecutive records with the same axis, kept in time order
+                        runs = np.split(np.arange(len(rows)), np.nonzero(np.diff(inverse))[0] + 1)
+                        parts = [(axes[inverse[r[0]]], rows[r]) for r in runs if len(r) > 0]
                     else:
-                        self.dBm  = np.concatenate( (self.dBm, dBm[:,:,port-1]), axis=0) if len(dBm.shape)>2  else  np.concatenate( (self.dBm, dBm[:]), axis=0)
-                        #self.dBm = np.concatenate( (self.dBm, dBm[:,:,port-1]), axis=0)
-                        self.dateTime = np.concatenate( (self.dateTime, f.get("/Data/datetime")[:]), axis=0)
-                        self.cpuTemp = np.concatenate( (self.cpuTemp, f.get("/Data/CPUtemperature")[:]), axis=0)
-                        self.loTemp = np.concatenate( (self.loTemp, f.get("/Data/LOtemperature")[:]), axis=0)
+                        parts = [(f.get("/Data/frequency")[:], slice(None))]
             except Exception as e:
                 print("FILE->", file)
                 print(e)
                 continue
 
+            for freq, rows in parts:
+                h = axisHash(freq)
+                group = self.axisGroups.setdefault(h, [])
+                if file not in group:
+                    group.append(file)
+                if self.empty and target is not None:
+                    self.freq = np.asarray(target, dtype=float)
+                elif self.empty:
+                    self.freq = freq
+                    targetHash = h
+                part = dBm[rows]
+                if h != targetHash:
+                    if regrid is None:
+                        print("FILE->", file)
+                        print("Different frequency axis, use regrid to load it")
+                        continue
+                    part = regridSpectra(part, freq, self.freq, regrid, h, targetHash)
+
+                if self.empty:
+                    self.dBm = part
+                    self.dateTime = dateTime[rows]
+                    self.cpuTemp = cpuTemp[rows]
+                    self.loTemp = loTemp[rows]
+                    #get the SA Metadata...
+                    self.rbdw = meta['Resolution Frequency']
+                    self.start = meta['Start Frequency']
+                    self.stop = meta['Stop Frequency']
+                    self.detector = meta['detector']
+                    self.navg = meta['navg']
+                    self.window = meta['window']
+                    self.empty = False
+                else:
+                    self.dBm  = np.concatenate( (self.dBm, part), axis=0)
+                    self.dateTime = np.concatenate( (self.dateTime, dateTime[rows]), axis=0)
+                    self.cpuTemp = np.concatenate( (self.cpuTemp, cpuTemp[rows]), axis=0)
+                    self.loTemp = np.concatenate( (self.loTemp, loTemp[rows]), axis=0)
+
+    def sweeps(self, files):
+        '''
+        Generator of the recorded sweeps as saSweep records (both ports),
+        one file in memory at a time, rows never written are skipped
+        '''
+        for file in files:
+            try:
+                with  h5py.File(file, 'r') as f:
+                    t = f.get("/Data/datetime")[:]
+                    valid = np.nonzero(t > 0)[0]
+                    if len(valid) == 0:
+                        continue
+                    if "frequencies" in f["Data"]:
+                        freqs = f.get("/Data/frequencies")[:]
+                    else:
+                        freqs = np.broadcast_to(f.get("/Data/frequency")[:], (len(t),) + f.get("/Data/frequency").shape)
+                    dBm = f.get("/Data/dBm")[:]
+                    lo = f.get("/Data/LOtemperature")[:]
+                    cpu = f.get("/Data/CPUtemperature")[:]
+            except Exception as e:
+                print("FILE->", file)
+                print(e)
+                continue
+            for i in valid:
+                yield saSweep(t[i], freqs[i], dBm[i], lo[i], cpu[i])
+
     def plot3D(self, mindB=-100, maxdB=-30 ):
+        from matplotlib import pyplot  as plt
+        from matplotlib import cm
+        from mpl_toolkits.mplot3d import Axes3D
         ## Matplotlib Sample Code using 2D arrays via meshgrid
         x = (self.dateTime -self.dateTime[0])/3600 #to hours
         y = self.freq/1000000  #To MHz
@@ -108,6 +172,8 @@ class spectraVNA():
         plt.show()
     
     def plot2D(self, mindB=-100, maxdB=-20):
+        from matplotlib import pyplot  as plt
+        from matplotlib import cm
 
         x = self.freq/1000000  #To MHz
         # y = (self.dateTime -self.dateTime[0])/3600 #to hours
@@ -129,6 +195,7 @@ class spectraVNA():
 
 
     def plotAvg(self):
+        from matplotlib import pyplot  as plt
         x = self.freq/1000000  #To MHz
         y = self.dBm.mean(axis=0)
         fig = plt.figure(num=2)
@@ -145,17 +212,35 @@ class spectraVNA():
 ##############################################################################################
 ##############################################################################################
 
-path = "/home/japaza/Documents/MRI/LibreVNApy/spcVNA4_2pol"
-# path = "/home/japaza/Documents/MRI/LibreVNApy/spcVNA3_2pol"
-path = "/home/japaza/Documents/MRI/LibreVNApy/spcTest" ##clean data n-s
-# # spcVNA3_2Pol  port1 = E-W
-# # spcVNA3_2Pol  port2 = N-S
-
-vna = spectraVNA()
-files = vna.locateFiles(path)
-
-vna.getData(files, port=2)
-
-# vna.plot3D()
-vna.plot2D()
-#vna.plotAvg()
+# spcVNA3_2Pol  port1 = E-W
+# spcVNA3_2Pol  port2 = N-S
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plot the RFI spectra recorded by autoSA.py")
+    parser.add_argument("path", help="directory with the spc_*.h5 files")
+    parser.add_argument("--port", type=int, default=2, choices=[1, 2], help="1 = E-W, 2 = N-S")
+    parser.add_argument("--plot", default="2d", choices=["2d", "3d", "avg"])
+    parser.add_argument("--min", type=float, default=-100, help="minimum dBm of the color scale")
+    parser.add_argument("--max", type=float, default=None, help="maximum dBm of the color scale")
+    parser.add_argument("--regrid", default=None, choices=["interp", "bin"],
+                        help="load files with other frequency axes onto the first file's axis")
+    args = parser.parse_args(argv)
+
+    vna = spectraVNA()
+    files = vna.locateFiles(args.path)
+    vna.getData(files, port=args.port, regrid=args.regrid)
+    if vna.empty:
+        print("No data found in", args.path)
+        return 1
+
+    if args.plot == "3d":
+        vna.plot3D(args.min, -30 if args.max is None else args.max)
+    elif args.plot == "avg":
+        vna.plotAvg()
+    else:
+        vna.plot2D(args.min, -20 if args.max is None else args.max)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+"""recorder.py:
+HDF5 archive of SA sweeps, rotating files every nblocks records.
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##########################################################################################
+
+import os
+import time
+from datetime import datetime
+import numpy as np
+import h5py
+
+MAXBLOCKS = 500
+
+
+class saRecorder():
+
+    def __init__(self, outPath, config, nblocks=3, prefix="spc_", swmr=False, averager=None):
+        '''
+        config: saConfig stored as metadata of every file
+        swmr: write in HDF5 single-writer/multiple-reader mode, so liveMonitor
+        can read the file that is being written
+        averager: sweepAverager applied on the host before writing, stored as metadata
+        '''
+        if not os.path.isdir(outPath):
+            raise Exception("Output path does not exist")
+        self.outPath = outPath
+        self.config = config
+        self.nblocks = nblocks
+        self.prefix = prefix
+        self.f = None
+        self.filename = None
+        self.freq = None
+        self.block = 0
+        self.pendingGaps = []
+        self.lastTimestamp = None
+        self.metrics = None     #metrics.metrics instance to instrument the writes
+        self.swmr = swmr
+        self.averager = averager
+        self.listeners = []     #callables receiving every sweep written, e.g. a queue put
+
+    def writeMetadata(self, b):
+        b.attrs['Start Frequency'] = self.config.start*1000000
+        b.attrs['Stop Frequency'] = self.config.stop*1000000
+        b.attrs['Resolution Frequency'] = self.config.rbw*1000
+        b.attrs['window'] = self.config.window
+        b.attrs['detector'] = self.config.detector
+        b.attrs['navg'] = self.config.navg
+        #host averaging on top of the device navg, "none" for the sweeps as acquired
+        if self.averager is None:
+            b.attrs['hostMode'] = "none"
+            b.attrs['hostAvg'] = 1
+        else:
+            b.attrs['hostMode'] = self.averager.mode
+            b.attrs['hostAvg'] = 0 if self.averager.n is None else self.averager.n     #0: hold forever
+            b.attrs['hostLinear'] = self.averager.linear
+
+    def createDatasets(self, a, sweep):
+        columns = len(sweep.freq)
+        a.create_dataset("dBm", (self.nblocks, columns, 2), maxshape=(MAXBLOCKS, columns, 2), dtype='f4')
+        a.create_dataset("LOtemperature", (self.nblocks,), maxshape=(MAXBLOCKS,), dtype='f4')
+        a.create_dataset("CPUtemperature", (self.nblocks,), maxshape=(MAXBLOCKS,), dtype='f4')
+
+    def writeRecord(self, a, sweep):
+        a["dBm"][self.block] = sweep.dBm
+        a["LOtemperature"][self.block] = sweep.loTemp
+        a["CPUtemperature"][self.block] = sweep.cpuTemp
+
+    def sameLayout(self, sweep):
+        return len(sweep.freq) == len(self.freq) and np.array_equal(sweep.freq, self.freq)
+
+    def newFile(self, sweep):
+        self.close()
+        #files created within the same second get a _001, _002... suffix (sorted after the first),
+        #an existing file is never truncated
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        seq = 0
+        while True:
+            suffix = "_{:03d}".format(seq) if seq > 0 else ""
+            self.filename = os.path.join(self.outPath, self.prefix+stamp+suffix+".h5")
+            try:
+                f = h5py.File(self.filename, 'x', libver='latest') if self.swmr else h5py.File(self.filename, 'x')
+                break
+            except FileExistsError:
+                seq += 1
+        print("Creating file -> ", os.path.basename(self.filename))
+        a = f.create_group('Data')
+
+        b = f.create_group('MetaData')
+        self.writeMetadata(b)
+        self.createDatasets(a, sweep)
+        a.create_dataset("frequency", (len(sweep.freq),), data=sweep.freq)
+        a.create_dataset("datetime", (self.nblocks,), maxshape=(MAXBLOCKS,), dtype='f8')
+        #acquisition gaps (start, stop) timestamps
+        a.create_dataset("gaps", (0, 2), maxshape=(None, 2), dtype='f8')
+        if self.swmr:
+            f.swmr_mode = True
+        self.f = f
+        self.freq = np.asarray(sweep.freq)
+        self.block = 0
+        self.writeGaps()
+        return f
+
+    def write(self, sweep):
+        '''
+        Store one sweep record, a new file is started when the current one is full
+        or the frequency axis changes
+        '''
+        if self.f is None or self.block == self.nblocks or not self.sameLayout(sweep):
+            self.newFile(sweep)
+        if self.metrics is not None:
+            if self.lastTimestamp is not None:
+                self.metrics.observe("sweep_interval_seconds", sweep.timestamp - self.lastTimestamp)
+            self.lastTimestamp = sweep.timestamp
+            t0 = time.perf_counter()
+        a = self.f["Data"]
+        self.writeRecord(a, sweep)
+        a["datetime"][self.block] = sweep.timestamp
+        self.block += 1
+        if self.metrics is not None:
+            t1 = time.perf_counter()
+            self.metrics.observe("h5_write_seconds", t1-t0)
+        self.f.flush()
+        if self.metrics is not None:
+            self.metrics.observe("h5_flush_seconds", time.perf_counter()-t1)
+            self.metrics.inc("sweeps_total")
+        for listener in self.listeners:
+            listener(sweep)
+
+    def addGap(self, start, stop):
+        '''
+        Record an interval without data, in the file that is open (or the next one)
+        '''
+        self.pendingGaps.append((start, stop))
+        self.writeGaps()
+
+    def writeGaps(self):
+        if self.f is None or len(self.pendingGaps) == 0:
+            return
+        gaps = self.f["Data/gaps"]
+        n = gaps.shape[0]
+        gaps.resize((n + len(self.pendingGaps), 2))
+        gaps[n:] = self.pendingGaps
+        self.pendingGaps = []
+        self.f.flush()
+
+    def close(self):
+        if self.f is not None:
+            try:
+                self.f.close()
+            except Exception as e:
+                print(e)
+            self.f = None
+
+
+class vnaRecorder(saRecorder):
+    '''
+    Same archive layout for VNA sweeps, the traces are stored as complex128
+    in Data/S (sweep, trace, point), chunked by sweep
+    '''
+
+    def __init__(self, outPath, config, nblocks=100, prefix="vna_", swmr=False):
+        saRecorder.__init__(self, outPath, config, nblocks, prefix, swmr)
+        self.traces = None
+
+    def writeMetadata(self, b):
+        b.attrs['Start Frequency'] = self.config.start*1000000
+        b.attrs['Stop Frequency'] = self.config.stop*1000000
+        b.attrs['IF Bandwidth'] = self.config.ifbw*1000
+        b.attrs['points'] = self.config.points
+        b.attrs['power'] = self.config.power
+        b.attrs['navg'] = self.config.navg
+
+    def createDatasets(self, a, sweep):
+        shape = (len(sweep.traces), len(sweep.freq))
+        a.create_dataset("S", (self.nblocks,)+shape, maxshape=(MAXBLOCKS,)+shape,
+                         chunks=(1,)+shape, dtype='c16')
+        a["S"].attrs['traces'] = list(sweep.traces)
+        self.traces = list(sweep.traces)
+
+    def writeRecord(self, a, sweep):
+        a["S"][self.block] = sweep.S
+
+    def sameLayout(self, sweep):
+        return saRecorder.sameLayout(self, sweep) and list(sweep.traces) == self.traces
+
+
+class revisitRecorder(saRecorder):
+    '''
+    Narrow sweeps centered on different bands in the same file. Every record keeps
+    its axis in Data/frequencies (sweep, point) and its band in Data/start, Data/stop,
+    MetaData Start/Stop Frequency is the range covered by the records written
+    (spectraVNA reads the per record axes, Data/frequency is only the first one)
+    '''
+
+    def __init__(self, outPath, config, nblocks=100, prefix="rev_"):
+        #not SWMR, the covered range attributes change after the file is created
+        saRecorder.__init__(self, outPath, config, nblocks, prefix)
+
+    def writeMetadata(self, b):
+        saRecorder.writeMetadata(self, b)
+        b.attrs['revisit'] = True
+
+    def createDatasets(self, a, sweep):
+        saRecorder.createDatasets(self, a, sweep)
+        columns = len(sweep.freq)
+        a.create_dataset("frequencies", (self.nblocks, columns), maxshape=(MAXBLOCKS, columns), dtype='f8')
+        a.create_dataset("start", (self.nblocks,), maxshape=(MAXBLOCKS,), dtype='f8')
+        a.create_dataset("stop", (self.nblocks,), maxshape=(MAXBLOCKS,), dtype='f8')
+
+    def writeRecord(self, a, sweep):
+        saRecorder.writeRecord(self, a, sweep)
+        start, stop = float(sweep.freq[0]), float(sweep.freq[-1])
+        a["frequencies"][self.block] = sweep.freq
+        a["start"][self.block] = start
+        a["stop"][self.block] = stop
+        b = self.f["MetaData"]
+        if self.block > 0:
+            start = min(start, b.attrs['Start Frequency'])
+            stop = max(stop, b.attrs['Stop Frequency'])
+        b.attrs['Start Frequency'] = start
+        b.attrs['Stop Frequency'] = stop
+
+    def sameLayout(self, sweep):
+        return len(sweep.freq) == len(self.freq)
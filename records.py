@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+
+"""records.py:
+Sweep records shared by the acquisition (libreVNA) and the analysis scripts,
+importing them does not load the socket client.
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##########################################################################################
+
+from collections import namedtuple
+
+#one spectrum record: timestamp, frequency (n,) in Hz, dBm (n, 2) for port 1 and 2
+saSweep = namedtuple("saSweep", ["timestamp", "freq", "dBm", "loTemp", "cpuTemp"])
+#one VNA record: timestamp, frequency (n,) in Hz, trace names, S (ntraces, n) complex128
+vnaSweep = namedtuple("vnaSweep", ["timestamp", "freq", "traces", "S"])
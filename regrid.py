@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""regrid.py:
+Move spectra between frequency axes, with the interpolation / binning
+weights computed once per (source axis, target axis) pair.
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##############################################################################################
+
+import hashlib
+import numpy as np
+
+METHODS = ["interp", "bin"]
+
+#(source hash, target hash, method) -> weights
+weightCache = {}
+
+
+def axisHash(freq):
+    return hashlib.sha1(np.ascontiguousarray(freq, dtype=np.float64).tobytes()).hexdigest()
+
+
+def checkAxes(src, dst):
+    if len(src) == 0 or len(dst) == 0:
+        raise ValueError("Empty frequency axis")
+
+
+def interpWeights(src, dst):
+    '''
+    Linear interpolation: dst = a[:, lo]*(1-w) + a[:, lo+1]*w, NaN outside src
+    a single point src is copied to the dst points at its frequency (lo=0, w=0)
+    '''
+    checkAxes(src, dst)
+    outside = (dst < src[0]) | (dst > src[-1])
+    if len(src) == 1:
+        return np.zeros(len(dst), dtype=np.intp), np.zeros(len(dst)), outside
+    lo = np.clip(np.searchsorted(src, dst) - 1, 0, len(src) - 2)
+    w = (dst - src[lo])/(src[lo+1] - src[lo])
+    return lo, w, outside
+
+
+def binWeights(src, dst):
+    '''
+    Bin aggregation: every src point goes to the dst bin whose center is closest,
+    returns the kept src points, the start of each run of points of a bin (for reduceat),
+    the dst bin of each run and its number of points
+    a single point dst is the closest bin of every src point
+    '''
+    checkAxes(src, dst)
+    if len(dst) == 1:
+        edges = np.array([-np.inf, np.inf])
+    else:
+        edges = np.concatenate(([dst[0] - (dst[1]-dst[0])/2], (dst[1:] + dst[:-1])/2, [dst[-1] + (dst[-1]-dst[-2])/2]))
+    idx = np.searchsorted(edges, src, side="right") - 1
+    keep = np.nonzero((idx >= 0) & (idx < len(dst)))[0]
+    idx = idx[keep]
+    starts = np.concatenate(([0], np.nonzero(np.diff(idx))[0] + 1))
+    bins = idx[starts]
+    counts = np.diff(np.concatenate((starts, [len(idx)])))
+    return keep, starts, bins, counts
+
+
+def weights(src, dst, method="interp", srcHash=None, dstHash=None):
+    if method not in METHODS:
+        raise ValueError("Invalid regrid method <{}>".format(", ".join(METHODS)))
+    key = (srcHash or axisHash(src), dstHash or axisHash(dst), method)
+    w = weightCache.get(key)
+    if w is None:
+        w = interpWeights(src, dst) if method == "interp" else binWeights(src, dst)
+        weightCache[key] = w
+    return w
+
+
+def regrid(dBm, src, dst, method="interp", srcHash=None, dstHash=None):
+    '''
+    dBm (sweeps, len(src)) onto dst, bins are averaged in linear power,
+    target points without data are NaN
+    '''
+    dBm = np.asarray(dBm, dtype=float)
+    w = weights(src, dst, method, srcHash, dstHash)
+    if method == "interp":
+        lo, frac, outside = w
+        #lo+1 stays within a single point src, its weight is 0
+        out = dBm[:, lo]*(1-frac) + dBm[:, np.minimum(lo+1, len(src)-1)]*frac
+        out[:, outside] = np.nan
+        return out
+    keep, starts, bins, counts = w
+    out = np.full((dBm.shape[0], len(dst)), np.nan)
+    if len(keep) == 0:
+        return out
+    lin = np.power(10.0, dBm[:, keep]/10)
+    out[:, bins] = 10*np.log10(np.add.reduceat(lin, starts, axis=1)/counts)
+    return out
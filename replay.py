@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+"""replay.py:
+Re-emit recorded spc_*.h5 sweeps, in real time, N times faster or as fast as
+possible, into the same sinks the live acquisition feeds (saRecorder.write,
+liveMonitor queueFollower.put, ...) and measure the throughput.
+
+    python3 replay.py /path/to/spc_files --speed 0 --out /tmp/replayed
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##############################################################################################
+
+import os
+import time
+import argparse
+import h5py
+from readVNA import spectraVNA
+from saConfig import saConfig
+from recorder import saRecorder
+
+
+def configFrom(file):
+    '''
+    saConfig with the metadata of a recorded file
+    '''
+    with h5py.File(file, 'r') as f:
+        m = f["/MetaData"].attrs
+        return saConfig(m['Start Frequency']/1000000, m['Stop Frequency']/1000000, m['Resolution Frequency']/1000,
+                        m['window'], m['detector'], int(m['navg']))
+
+
+class archiveReplay():
+
+    def __init__(self, files, speed=1.0, maxGap=None, tmin=None, tmax=None):
+        '''
+        files: spc_*.h5 files (or a directory), speed: archive seconds per wall second,
+        0 or None as fast as possible, maxGap: longer pauses between sweeps (outages)
+        are replayed as maxGap archive seconds, tmin, tmax: timestamps to replay
+        '''
+        self.spc = spectraVNA()
+        if isinstance(files, str):
+            files = self.spc.locateFiles(files)
+        self.files = files
+        self.speed = speed
+        self.maxGap = maxGap
+        self.tmin = tmin
+        self.tmax = tmax
+        self.metrics = None     #metrics.metrics instance, lag and sweep count
+        self.running = False
+        self.stats = {}
+
+    def sweeps(self):
+        for sweep in self.spc.sweeps(self.files):
+            if self.tmin is not None and sweep.timestamp < self.tmin:
+                continue
+            if self.tmax is not None and sweep.timestamp > self.tmax:
+                break
+            yield sweep
+
+    def run(self, sinks, count=None):
+        '''
+        Feed every sweep to the sinks (callables receiving a saSweep), count: stop after n sweeps
+        returns the throughput stats
+        '''
+        if callable(sinks):
+            sinks = [sinks]
+        self.running = True
+        n = 0
+        maxLag = 0.0
+        sinkTime = 0.0
+        archiveTime = 0.0
+        last = None
+        t0 = time.perf_counter()
+        for sweep in self.sweeps():
+            if not self.running or (count is not None and n >= count):
+                break
+            if last is not None:
+                dt = max(float(sweep.timestamp) - last, 0.0)
+                archiveTime += dt if self.maxGap is None else min(dt, self.maxGap)
+            last = float(sweep.timestamp)
+            if self.speed:
+                #scheduled from the start, the sleeps do not accumulate drift
+                lag = time.perf_counter() - (t0 + archiveTime/self.speed)
+                if lag < 0:
+                    time.sleep(-lag)
+                maxLag = max(maxLag, lag)
+                if self.metrics is not None:
+                    self.metrics.observe("replay_lag_seconds", max(lag, 0.0))
+            t1 = time.perf_counter()
+            for sink in sinks:
+                sink(sweep)
+            sinkTime += time.perf_counter() - t1
+            n += 1
+            if self.metrics is not None:
+                self.metrics.inc("replay_sweeps_total")
+        wall = time.perf_counter() - t0
+        self.running = False
+        self.stats = {"sweeps": n, "seconds": wall, "sweeps_per_s": n/wall if wall > 0 else 0.0,
+                      "sink_seconds": sinkTime, "archive_seconds": archiveTime,
+                      "speedup": archiveTime/wall if wall > 0 else 0.0, "max_lag_seconds": maxLag}
+        return self.stats
+
+    def stop(self):
+        self.running = False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded RFI spectra")
+    parser.add_argument("path", help="directory with the spc_*.h5 files")
+    parser.add_argument("--speed", type=float, default=1, help="times real time, 0 as fast as possible")
+    parser.add_argument("--max-gap", type=float, default=None, help="longest pause replayed, archive seconds")
+    parser.add_argument("--count", type=int, default=None)
+    parser.add_argument("--out", default=None, help="re-record the sweeps with saRecorder in this directory")
+    parser.add_argument("--nblocks", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    replay = archiveReplay(args.path, args.speed, args.max_gap)
+    if len(replay.files) == 0:
+        print("No files in", args.path)
+        return 1
+    sinks = []
+    recorder = None
+    if args.out is not None:
+        os.makedirs(args.out, exist_ok=True)
+        recorder = saRecorder(args.out, configFrom(replay.files[0]), args.nblocks)
+        sinks.append(recorder.write)
+    try:
+        stats = replay.run(sinks, args.count)
+    finally:
+        if recorder is not None:
+            recorder.close()
+    print("{sweeps} sweeps in {seconds:.2f} s, {sweeps_per_s:.1f} sweeps/s, {speedup:.1f}x real time, "
+          "sinks {sink_seconds:.2f} s, max lag {max_lag_seconds:.3f} s".format(**stats))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
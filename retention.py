@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+
+"""retention.py:
+Keep the raw spc_*.h5 (or rev_*.h5) files for a recent window, compact older days into
+per interval max/mean/min files (cmp_*.h5, readable by spectraVNA) and keep
+the whole output within a disk budget.
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##############################################################################################
+
+import os
+import time
+import argparse
+import multiprocessing
+from datetime import datetime
+import numpy as np
+import h5py
+from regrid import axisHash
+
+
+def reduceRows(keys, vmax, vmin, vsum, count, lo, cpu):
+    '''
+    Combine rows with the same interval key (keys sorted): max, min and sums
+    '''
+    first = np.concatenate(([0], np.nonzero(np.diff(keys))[0] + 1))
+    return (keys[first], np.maximum.reduceat(vmax, first, axis=0), np.minimum.reduceat(vmin, first, axis=0),
+            np.add.reduceat(vsum, first, axis=0), np.add.reduceat(count, first), np.add.reduceat(lo, first),
+            np.add.reduceat(cpu, first))
+
+
+class retentionManager():
+
+    def __init__(self, path, rawDays=7, interval=600, budget=None, archivePath=None, prefix="spc_"):
+        '''
+        path: recorder output, rawDays: days kept at full resolution,
+        interval: seconds per compacted row, budget: bytes for raw + compacted files,
+        prefix: raw files handled, e.g. "rev_" for the revisitRecorder output
+        '''
+        self.path = path
+        self.rawDays = rawDays
+        self.interval = interval
+        self.budget = budget
+        self.archivePath = archivePath if archivePath is not None else os.path.join(path, "archive")
+        self.prefix = prefix
+        self.process = None
+        self.stopEvent = None
+        self.companions = []    #retentionManagers of other directories sharing this budget
+
+    def rawFiles(self):
+        return sorted(os.path.join(self.path, f) for f in os.listdir(self.path)
+                      if f.startswith(self.prefix) and f.endswith(".h5"))
+
+    def compactedFiles(self):
+        if not os.path.isdir(self.archivePath):
+            return []
+        return sorted(os.path.join(self.archivePath, f) for f in os.listdir(self.archivePath)
+                      if f.startswith("cmp_") and f.endswith(".h5"))
+
+    def badFiles(self):
+        '''
+        Files moved to archivePath/bad by quarantine, oldest first
+        '''
+        bad = os.path.join(self.archivePath, "bad")
+        if not os.path.isdir(bad):
+            return []
+        return sorted((os.path.join(bad, f) for f in os.listdir(bad)), key=os.path.getmtime)
+
+    def pendingDays(self, now=None):
+        '''
+        {day: [files]} of the raw files whose whole day is older than the raw window
+        '''
+        now = time.time() if now is None else now
+        limit = datetime.fromtimestamp(now - self.rawDays*86400).strftime("%Y%m%d")
+        days = {}
+        for file in self.rawFiles():
+            day = datetime.fromtimestamp(os.path.getmtime(file)).strftime("%Y%m%d")
+            if day < limit:
+                days.setdefault(day, []).append(file)
+        return days
+
+    def compactedSources(self, day):
+        '''
+        Names of the raw files already contained in the compacted files of a day
+        '''
+        sources = set()
+        for file in self.compactedFiles():
+            if not os.path.basename(file).startswith("cmp_{}_".format(day)):
+                continue
+            try:
+                with h5py.File(file, 'r') as f:
+                    if "sources" in f["Data"]:
+                        sources.update(f["Data/sources"].asstr()[:])
+            except Exception as e:
+                print("FILE->", file)
+                print(e)
+        return sources
+
+    def quarantine(self, file):
+        '''
+        Move an unreadable raw file (e.g. truncated by a crash) out of the way
+        '''
+        bad = os.path.join(self.archivePath, "bad")
+        os.makedirs(bad, exist_ok=True)
+        os.replace(file, os.path.join(bad, os.path.basename(file)))
+        print("Unreadable file moved to", bad)
+
+    def readRaw(self, file):
+        '''
+        Valid rows of one raw file reduced per interval, split by frequency axis
+        when the file keeps one per record (Data/frequencies, revisit files)
+        returns [(hash, freq, metadata, reduced or None, rows)]
+        '''
+        with h5py.File(file, 'r') as f:
+            t = f["/Data/datetime"][:]
+            valid = t > 0
+            freq = f["/Data/frequency"][:]
+            meta = dict(f["/MetaData"].attrs)
+            if not valid.any():
+                return [(axisHash(freq), freq, meta, None, 0)]
+            t = t[valid]
+            order = np.argsort(t, kind="stable")
+            t = t[order]
+            dBm = f["/Data/dBm"][:][valid][order].astype(float)
+            lo = f["/Data/LOtemperature"][:][valid][order].astype(float)
+            cpu = f["/Data/CPUtemperature"][:][valid][order].astype(float)
+            axes = f["/Data/frequencies"][:][valid][order] if "frequencies" in f["Data"] else None
+
+        if axes is None:
+            parts = [(freq, meta, np.ones(len(t), dtype=bool))]
+        else:
+            uniq, inverse = np.unique(axes, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            parts = []
+            for i, freq in enumerate(uniq):
+                #each compacted file covers its own axis only
+                m = dict(meta)
+                m['Start Frequency'] = freq[0]
+                m['Stop Frequency'] = freq[-1]
+                parts.append((freq, m, inverse == i))
+        out = []
+        for freq, m, rows in parts:
+            keys = np.floor(t[rows]/self.interval).astype(np.int64)
+            n = len(keys)
+            reduced = reduceRows(keys, dBm[rows], dBm[rows], np.power(10.0, dBm[rows]/10), np.ones(n, dtype=np.int64),
+                                 lo[rows], cpu[rows])
+            out.append((axisHash(freq), freq, m, reduced, n))
+        return out
+
+    def compactDay(self, day, files):
+        '''
+        Reduce the files one at a time into running max/min/sum rows per axis,
+        the files already in a compacted file (an interrupted pass) are not added again
+        '''
+        done = self.compactedSources(day)
+        groups = {}     #hash -> [freq, metadata, reduced, rows, sources]
+        for file in files:
+            name = os.path.basename(file)
+            if name in done:
+                continue
+            try:
+                parts = self.readRaw(file)
+            except (OSError, KeyError) as e:
+                #unreadable or incomplete file, any other error stops the pass with the file in place
+                print("FILE->", file)
+                print(e)
+                self.quarantine(file)
+                continue
+            for h, freq, meta, reduced, n in parts:
+                g = groups.setdefault(h, [freq, meta, None, 0, []])
+                if reduced is not None:
+                    g[2] = reduced if g[2] is None else self.merge(g[2], reduced)
+                g[3] += n
+                g[4].append(name)
+
+        os.makedirs(self.archivePath, exist_ok=True)
+        for h, (freq, meta, reduced, nraw, sources) in groups.items():
+            outFile = os.path.join(self.archivePath, "cmp_{}_{}.h5".format(day, h[:8]))
+            if os.path.exists(outFile):
+                #files of this day compacted by an earlier pass
+                old, oldSources = self.readCompacted(outFile)
+                reduced = old if reduced is None else self.merge(old, reduced)
+                nraw += int(old[4].sum())
+                sources = oldSources + sources
+            if reduced is None:
+                continue
+            if not self.writeCompacted(outFile, freq, meta, reduced, nraw, sources):
+                print("Verification failed for", outFile, ", originals kept")
+                return 0
+
+        removed = 0
+        for file in files:
+            if os.path.exists(file):
+                os.remove(file)
+                removed += 1
+        print("Compacted {} files of {}".format(removed, day))
+        return removed
+
+    def readCompacted(self, filename):
+        '''
+        Reduced rows and source file names of a compacted file
+        '''
+        with h5py.File(filename, 'r') as f:
+            a = f["Data"]
+            count = a["count"][:]
+            c = count[:, None, None]
+            sources = list(a["sources"].asstr()[:]) if "sources" in a else []
+            return (np.floor(a["datetime"][:]/self.interval).astype(np.int64), a["dBmMax"][:].astype(float),
+                    a["dBmMin"][:].astype(float), np.power(10.0, a["dBm"][:].astype(float)/10)*c, count,
+                    a["LOtemperature"][:]*count, a["CPUtemperature"][:]*count), sources
+
+    @staticmethod
+    def merge(a, b):
+        order = np.argsort(np.concatenate((a[0], b[0])), kind="stable")
+        rows = [np.concatenate((x, y))[order] for x, y in zip(a, b)]
+        return reduceRows(*rows)
+
+    def writeCompacted(self, filename, freq, meta, reduced, nraw, sources):
+        keys, vmax, vmin, vsum, count, lo, cpu = reduced
+        c = count[:, None, None]
+        mean = 10*np.log10(vsum/c)
+        tmp = filename + ".tmp"
+        with h5py.File(tmp, 'w') as f:
+            a = f.create_group('Data')
+            b = f.create_group('MetaData')
+            for k, v in meta.items():
+                b.attrs[k] = v
+            b.attrs['interval'] = self.interval
+            #dBm is the mean so spectraVNA loads compacted files like raw ones
+            a.create_dataset("dBm", data=mean.astype('f4'))
+            a.create_dataset("dBmMax", data=vmax.astype('f4'))
+            a.create_dataset("dBmMin", data=vmin.astype('f4'))
+            a.create_dataset("count", data=count)
+            a.create_dataset("frequency", data=freq)
+            a.create_dataset("datetime", data=keys.astype(float)*self.interval)
+            a.create_dataset("LOtemperature", data=(lo/count).astype('f4'))
+            a.create_dataset("CPUtemperature", data=(cpu/count).astype('f4'))
+            #raw files already included, skipped if a pass is resumed
+            a.create_dataset("sources", data=sources, dtype=h5py.string_dtype())
+
+        #read back before the originals are deleted
+        try:
+            with h5py.File(tmp, 'r') as f:
+                a = f["Data"]
+                ok = (a["count"][:].sum() == nraw
+                      and len(a["sources"]) == len(sources)
+                      and np.array_equal(a["dBmMax"][:], vmax.astype('f4'))
+                      and np.array_equal(a["dBmMin"][:], vmin.astype('f4'))
+                      and a["dBm"].shape == vmax.shape
+                      and np.array_equal(a["frequency"][:], freq))
+        except Exception as e:
+            print(e)
+            ok = False
+        if not ok:
+            os.remove(tmp)
+            return False
+        os.replace(tmp, filename)
+        return True
+
+    def enforceBudget(self):
+        '''
+        Delete the quarantined files, then the oldest compacted files,
+        while raw + compacted + quarantined exceed the budget, the companions included
+        '''
+        if self.budget is None:
+            return 0
+        managers = [self] + self.companions
+        raw = [f for m in managers for f in m.rawFiles()]
+        cmp = sorted((f for m in managers for f in m.compactedFiles()), key=os.path.basename)
+        bad = sorted((f for m in managers for f in m.badFiles()), key=os.path.getmtime)
+        total = sum(os.path.getsize(f) for f in raw + cmp + bad)
+        removed = 0
+        for f in bad + cmp:
+            if total <= self.budget:
+                break
+            total -= os.path.getsize(f)
+            os.remove(f)
+            removed += 1
+            print("Budget exceeded, removed", os.path.basename(f))
+        if total > self.budget:
+            print("Raw files alone exceed the disk budget, reduce rawDays")
+        return removed
+
+    def step(self, maxDays=1, now=None):
+        '''
+        One incremental pass: compact up to maxDays days and enforce the budget
+        '''
+        days = self.pendingDays(now)
+        done = 0
+        for day in sorted(days)[:maxDays]:
+            done += self.compactDay(day, days[day])
+        self.enforceBudget()
+        return done
+
+    def start(self, period=600, niceness=19):
+        '''
+        Run step() every period seconds in a separate low priority process, so the
+        compaction never competes with the acquisition for the interpreter lock.
+        Forked, the acquisition scripts have no __main__ guard to re-import safely
+        '''
+        ctx = multiprocessing.get_context("fork")
+        self.stopEvent = ctx.Event()
+        self.process = ctx.Process(target=self.loop, args=(period, niceness), daemon=True)
+        self.process.start()
+
+    def loop(self, period, niceness):
+        try:
+            os.nice(niceness)
+        except OSError:
+            pass
+        while not self.stopEvent.is_set():
+            try:
+                #catch up one day at a time, quickly while there is backlog
+                while not self.stopEvent.is_set() and self.step() > 0:
+                    self.stopEvent.wait(1)
+            except Exception as e:
+                print("Retention:", e)
+            self.stopEvent.wait(period)
+
+    def stop(self, timeout=10):
+        '''
+        Ask the process to finish after the current step, the compacted files are
+        written aside and renamed, so terminating it later loses no data
+        '''
+        if self.process is None:
+            return
+        self.stopEvent.set()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.process = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact aged RFI spectra")
+    parser.add_argument("path", help="directory with the spc_*.h5 files")
+    parser.add_argument("--raw-days", type=float, default=7)
+    parser.add_argument("--interval", type=float, default=600, help="seconds per compacted row")
+    parser.add_argument("--budget-gb", type=float, default=None)
+    parser.add_argument("--archive", default=None, help="compacted files directory (path/archive)")
+    parser.add_argument("--prefix", default="spc_", help="raw files to compact, rev_ for the revisit directory")
+    args = parser.parse_args(argv)
+
+    budget = None if args.budget_gb is None else args.budget_gb*1e9
+    rm = retentionManager(args.path, args.raw_days, args.interval, budget, args.archive, args.prefix)
+    while rm.step() > 0:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""saConfig.py:
+Desired spectrum analyzer state, applied to the device sending only the
+settings that differ from the current ones.
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##########################################################################################
+
+from libreVNA import libreVNA
+
+
+class saConfig():
+
+    #queries of the range limits, to order the start/stop changes
+    startQuery = ":SA:FREQ:START?"
+    stopQuery = ":SA:FREQ:STOP?"
+
+    def __init__(self, start=1, stop=100, rbw=50, window="KAISER", detector="AVERAGE", navg=1, signalID=True):
+        '''
+        start, stop in MHz, RBW in KHz (same units as the libreVNA setters)
+        '''
+        self.start = start
+        self.stop = stop
+        self.rbw = rbw
+        self.window = window
+        self.detector = detector
+        self.navg = navg
+        self.signalID = signalID
+
+    def values(self):
+        '''
+        Desired settings as the device reports them, keyed by query
+        '''
+        return {
+            ":SA:FREQ:START?": float(self.start*1000000),
+            ":SA:FREQ:STOP?": float(self.stop*1000000),
+            ":SA:ACQ:RBW?": float(self.rbw*1000),
+            ":SA:ACQ:WIND?": libreVNA.windowName(self.window),
+            ":SA:ACQ:DET?": libreVNA.detectorName(self.detector),
+            ":SA:ACQ:AVG?": float(int(self.navg)),
+            ":SA:ACQ:SIG?": "TRUE" if self.signalID else "FALSE",
+        }
+
+    @staticmethod
+    def same(desired, current):
+        if isinstance(desired, float):
+            try:
+                return abs(float(current) - desired) <= 1e-9*max(abs(desired), 1.0)
+            except ValueError:
+                return False
+        return current == desired
+
+    @staticmethod
+    def format(value):
+        if isinstance(value, float):
+            return str(int(value)) if value.is_integer() else str(value)
+        return value
+
+    def diff(self, state):
+        '''
+        Settings whose value in state (query -> answer) differs from this configuration
+        '''
+        return {q: v for q, v in self.values().items() if not self.same(v, state.get(q))}
+
+    def apply(self, vna, refresh=True):
+        '''
+        Read the device state in one batch (or use the cache if refresh is False),
+        send the differing settings and confirm them with a single readback.
+        Returns the number of settings changed, -1 if some were not accepted.
+        '''
+        return self.applyValues(vna, self.values(), refresh)
+
+    @classmethod
+    def applyValues(cls, vna, values, refresh=True):
+        '''
+        apply for any subset of the settings (query -> value as the device reports it),
+        e.g. only the range and RBW of a sweepPlanner segment
+        '''
+        #only the given queries, no VNA settings while in SA mode or vice versa
+        state = vna.read_state(values) if refresh else {q: vna.cached_query(q) for q in values}
+        changes = {q: v for q, v in values.items() if not cls.same(v, state.get(q))}
+        if len(changes) == 0:
+            return 0
+
+        queries = list(changes)
+        #moving the range up past the current stop: set the stop first
+        start, stop = cls.startQuery, cls.stopQuery
+        if start in changes and stop in changes:
+            try:
+                if changes[start] >= float(state.get(stop)):
+                    queries.remove(stop)
+                    queries.insert(0, stop)
+            except (TypeError, ValueError):
+                pass
+
+        vna.cmd_batch([vna.cached[q]+" "+cls.format(changes[q]) for q in queries])
+        answers = vna.query_batch(queries)
+        ok = True
+        for q, ans in zip(queries, answers):
+            if cls.same(changes[q], ans):
+                vna.state[q] = ans
+            else:
+                vna.invalidate(q)
+                print("Failed to set {} -> {}".format(vna.cached[q], cls.format(changes[q])))
+                ok = False
+        return len(queries) if ok else -1
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+"""scheduler.py:
+Interleave the full span survey with narrow, finer RBW revisit sweeps
+centered on the bands that were active in the recent survey sweeps,
+spending at most a fixed fraction of the survey time on them.
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##########################################################################################
+
+import time
+import numpy as np
+from saConfig import saConfig
+
+
+def activeBands(freq, excess, threshold, minGap):
+    '''
+    Runs of bins above threshold (dB over the floor), merged when closer than minGap Hz
+    returns [(lo, hi, peak frequency, peak excess)] in Hz and dB
+    '''
+    idx = np.nonzero(excess > threshold)[0]
+    if len(idx) == 0:
+        return []
+    breaks = np.nonzero(np.diff(freq[idx]) > minGap)[0] + 1
+    bands = []
+    for run in np.split(idx, breaks):
+        peak = run[np.argmax(excess[run])]
+        bands.append((freq[run[0]], freq[run[-1]], freq[peak], excess[peak]))
+    return bands
+
+
+class adaptiveScheduler():
+
+    def __init__(self, survey, recorder, revisitRBW=5, revisitSpan=2, budget=0.25, threshold=10,
+                 hold=300, maxRevisits=4):
+        '''
+        survey: saConfig of the full span sweep, recorder: revisitRecorder for the revisits
+        revisitRBW in KHz, revisitSpan in MHz, budget: revisit seconds per survey second,
+        threshold: dB over the noise floor to flag a bin, hold: seconds a bin stays active
+        after it was last above threshold
+        '''
+        self.survey = survey
+        self.recorder = recorder
+        self.revisitRBW = revisitRBW
+        self.revisitSpan = revisitSpan
+        self.budget = budget
+        self.threshold = threshold
+        self.hold = hold
+        self.maxRevisits = maxRevisits
+        self.acquire = lambda vna: vna.acquire_sweep()      #survey step, e.g. with host averaging
+        self.metrics = None     #metrics.metrics instance
+        self.credit = 0.0       #revisit seconds available
+        self.sweepTimes = {}    #sweep time estimate of each configuration
+        self.lastRevisit = {}   #revisit center -> timestamp
+        self.freq = None
+        self.lastActive = None
+        self.held = None
+
+    def revisitConfig(self, center):
+        '''
+        saConfig of the revisit around center (Hz), snapped to a quarter of the span
+        so the same emitter is always swept with the same axis
+        '''
+        span = self.revisitSpan*1000000
+        grid = span/4
+        center = round(center/grid)*grid
+        start = max(center - span/2, self.survey.start*1000000)
+        stop = min(center + span/2, self.survey.stop*1000000)
+        s = self.survey
+        return center, saConfig(start/1000000, stop/1000000, self.revisitRBW, s.window, s.detector, s.navg, s.signalID)
+
+    def analyze(self, sweep):
+        '''
+        Update the per bin activity with a survey sweep, the floor is the median of each port
+        '''
+        freq = np.asarray(sweep.freq)
+        if self.freq is None or len(freq) != len(self.freq) or not np.array_equal(freq, self.freq):
+            self.freq = freq
+            self.lastActive = np.full(len(freq), -np.inf)
+            self.held = np.zeros(len(freq))
+        dBm = np.asarray(sweep.dBm, dtype=float)
+        excess = (dBm - np.median(dBm, axis=0)).max(axis=1)
+        active = excess > self.threshold
+        self.lastActive[active] = sweep.timestamp
+        self.held[active] = excess[active]
+
+    def pending(self, now):
+        '''
+        Revisits due, the least recently visited first, then the strongest
+        '''
+        if self.freq is None:
+            return []
+        recent = now - self.lastActive <= self.hold
+        excess = np.where(recent, self.held, 0.0)
+        bands = activeBands(self.freq, excess, 0.0, self.revisitSpan*1000000/2)
+        revisits = {}
+        for lo, hi, peak, level in bands:
+            center, config = self.revisitConfig(peak)
+            if center not in revisits or revisits[center][0] < level:
+                revisits[center] = (level, config)
+        order = sorted(revisits, key=lambda c: (self.lastRevisit.get(c, -np.inf), -revisits[c][0]))
+        return [(c, revisits[c][1]) for c in order]
+
+    def sweep(self, vna, config):
+        '''
+        Configure and acquire one sweep, each configuration keeps its own sweep time estimate
+        '''
+        key = tuple(config.values().items())
+        t0 = time.time()
+        config.apply(vna, refresh=False)
+        vna.sweepTime = self.sweepTimes.get(key)
+        sweep = self.acquire(vna) if config is self.survey else vna.acquire_sweep()
+        self.sweepTimes[key] = vna.sweepTime
+        return sweep, time.time() - t0
+
+    def step(self, vna):
+        '''
+        One survey sweep followed by the revisits the budget allows,
+        the revisits are written to the revisit recorder, the survey sweep is returned
+        '''
+        sweep, elapsed = self.sweep(vna, self.survey)
+        #the unused credit is capped to one survey worth, no long revisit bursts
+        self.credit = min(self.credit + self.budget*elapsed, self.budget*elapsed)
+        if sweep is not None:
+            self.analyze(sweep)
+        n = 0
+        for center, config in self.pending(time.time()):
+            if self.credit <= 0 or n >= self.maxRevisits:
+                break
+            rev, t = self.sweep(vna, config)
+            self.credit -= t
+            self.lastRevisit[center] = rev.timestamp
+            self.recorder.write(rev)
+            n += 1
+            if self.metrics is not None:
+                self.metrics.observe("revisit_seconds", t)
+                self.metrics.inc("revisits_total")
+        return sweep
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""supervisor.py:
+Keep an acquisition session alive: on a GUI timeout or a dropped socket
+reconnect, re-apply the configuration and keep writing to the same archive.
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##########################################################################################
+
+import time
+from libreVNA import libreVNA, GUITimeoutError
+
+#errors that mean the GUI session is gone or stalled
+RECOVERABLE = (GUITimeoutError, OSError)
+
+
+class acqSupervisor():
+
+    def __init__(self, config, host='localhost', port=19542, device="", mode="SA",
+                 minBackoff=0.1, maxBackoff=2.0):
+        '''
+        config: saConfig re-applied after every reconnection
+        '''
+        self.config = config
+        self.host = host
+        self.port = port
+        self.device = device
+        self.mode = mode
+        self.minBackoff = minBackoff
+        self.maxBackoff = maxBackoff
+        self.vna = None
+        self.lastSweep = None
+        self.gaps = []
+        self.metrics = None     #metrics.metrics passed on to every session
+        self.sweepTime = None   #sweep time estimate, kept across sessions
+
+    def session(self):
+        '''
+        Open a new session with the GUI, connect the device and apply the configuration
+        '''
+        self.close()
+        vna = libreVNA(self.host, self.port)
+        self.vna = vna
+        vna.metrics = self.metrics
+        vna.sweepTime = self.sweepTime
+        vna.cmd(":DEV:CONN "+self.device)
+        vna.invalidate()
+        if vna.query(":DEV:CONN?") == "Not connected":
+            raise Exception("Not connected to any device")
+        if vna.get_mode() != self.mode and not vna.set_mode(self.mode):
+            raise Exception("Failed to set mode")
+        if self.config.apply(vna) < 0:
+            raise Exception("Failed to apply the configuration")
+        return vna
+
+    def recover(self):
+        '''
+        Retry the session with exponential backoff until it is back,
+        returns the time it took
+        '''
+        t0 = time.time()
+        backoff = self.minBackoff
+        while True:
+            try:
+                self.session()
+                break
+            except Exception as e:
+                print("Reconnection failed:", e)
+                time.sleep(backoff)
+                backoff = min(backoff*2, self.maxBackoff)
+        print("Session recovered in {:.2f} s".format(time.time()-t0))
+        if self.metrics is not None:
+            self.metrics.observe("recovery_seconds", time.time()-t0)
+        return time.time()-t0
+
+    def run(self, step, recorder, count=None):
+        '''
+        Call step(vna) -> saSweep or None in a loop and store the sweeps,
+        the intervals lost in reconnections are recorded as gaps
+        '''
+        if self.vna is None:
+            self.recover()
+        n = 0
+        while count is None or n < count:
+            try:
+                sweep = step(self.vna)
+            except RECOVERABLE as e:
+                print("Acquisition interrupted:", e)
+                start = self.lastSweep if self.lastSweep is not None else time.time()
+                self.recover()
+                self.gaps.append((start, time.time()))
+                recorder.addGap(*self.gaps[-1])
+                continue
+            if sweep is not None:
+                recorder.write(sweep)
+                self.lastSweep = sweep.timestamp
+                n += 1
+
+    def close(self):
+        if self.vna is not None:
+            if self.vna.sweepTime is not None:
+                self.sweepTime = self.vna.sweepTime
+            try:
+                self.vna.sock.close()
+            except OSError:
+                pass
+            self.vna = None
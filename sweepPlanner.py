@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""sweepPlanner.py:
+Split a wide SA range into segments the device can sweep and stitch
+the results back into a single spectrum.
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##########################################################################################
+
+from math import ceil
+import numpy as np
+from records import saSweep
+from saConfig import saConfig
+
+
+class sweepPlanner():
+
+    def __init__(self, vna, pointsPerRBW=2, overlap=0.02, limits=None):
+        '''
+        pointsPerRBW: trace points the device places on each RBW
+        overlap: fraction of extra span swept on each segment to cover the joints
+        '''
+        self.vna = vna
+        self.limits = limits if limits is not None else vna.get_limits()
+        self.pointsPerRBW = pointsPerRBW
+        self.overlap = overlap
+        self.reverse = False
+
+    def segmentSpan(self, rbw):
+        '''
+        Widest span in Hz that keeps the RBW (Hz) within the point limit
+        '''
+        return (self.limits["maxPoints"]-1)/self.pointsPerRBW*rbw
+
+    def plan(self, start, stop, rbw):
+        '''
+        start, stop in MHz, RBW in KHz (same units as the setters)
+        returns RBW in KHz and a list of segments (lo, hi, center, span) in Hz,
+        lo-hi is the part of the segment kept when stitching
+        '''
+        rbw = min(max(rbw*1000, self.limits["minRBW"]), self.limits["maxRBW"])
+        start = max(start*1000000, self.limits["minF"])
+        stop = min(stop*1000000, self.limits["maxF"])
+        if stop <= start:
+            raise ValueError("Invalid frequency range")
+
+        total = stop - start
+        maxSpan = self.segmentSpan(rbw)
+        n = ceil(total*(1+self.overlap)/maxSpan)
+        step = total/n
+        span = min(step*(1+self.overlap), maxSpan) if n > 1 else total
+        #all segments share the same span, so moving between them is a single center change
+        segments = []
+        for i in range(n):
+            lo = start + i*step
+            hi = stop if i == n-1 else lo + step
+            center = lo + step/2
+            center = min(max(center, self.limits["minF"] + span/2), self.limits["maxF"] - span/2)
+            segments.append((lo, hi, center, span))
+        return rbw/1000, segments
+
+    def configure(self, rbw, center, span):
+        '''
+        Set the segment range and RBW (KHz) in one batch with a single readback,
+        only the settings that differ from the device state cached in vna.state are sent
+        (the same state saConfig.apply keeps, so neither reconfigures after the other)
+        returns the number of settings changed, -1 if some were not accepted
+        '''
+        values = {
+            saConfig.startQuery: float(round(center - span/2)),     #whole Hz, as the device reports them
+            saConfig.stopQuery: float(round(center + span/2)),
+            ":SA:ACQ:RBW?": float(rbw*1000),
+        }
+        return saConfig.applyValues(self.vna, values, refresh=False)
+
+    def sweep(self, start, stop, rbw, timeout=None):
+        '''
+        Sweep start-stop (MHz) at RBW (KHz), returns a saSweep with the stitched
+        frequency (Hz) and dBm of both ports, stamped at the end of the last segment
+        '''
+        rbw, segments = self.plan(start, stop, rbw)
+        order = list(range(len(segments)))
+        #serpentine order: the next pass starts where this one ends, saving a reconfiguration
+        if self.reverse:
+            order.reverse()
+        self.reverse = not self.reverse
+
+        results = [None]*len(segments)
+        last = None
+        for i in order:
+            lo, hi, center, span = segments[i]
+            if self.configure(rbw, center, span) < 0:
+                raise Exception("Failed to configure the segment centered at {:.3f} MHz".format(center/1000000))
+            #a triggered sweep, the trace of the previous one is never read again
+            #when the segment needs no reconfiguration
+            last = self.vna.acquire_sweep(timeout)
+            results[i] = (last.freq, last.dBm)
+        freq, dBm = self.stitch(segments, results)
+        return saSweep(last.timestamp, freq, dBm, last.loTemp, last.cpuTemp)
+
+    @staticmethod
+    def stitch(segments, results):
+        '''
+        Join per segment (freq, dBm) results into one spectrum, keeping
+        each segment's lo-hi part only so overlapping bins are not repeated
+        '''
+        freqs = []
+        dBms = []
+        last = len(segments) - 1
+        for i, ((lo, hi, center, span), (freq, dBm)) in enumerate(zip(segments, results)):
+            keep = (freq >= lo) & ((freq <= hi) if i == last else (freq < hi))
+            freqs.append(freq[keep])
+            dBms.append(dBm[keep])
+        return np.concatenate(freqs), np.concatenate(dBms, axis=0)
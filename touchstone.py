@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""touchstone.py:
+Read the VNA archive written by recorder.vnaRecorder and export
+selected time ranges as Touchstone files.
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##############################################################################################
+
+import os
+from math import isqrt
+from datetime import datetime
+import numpy as np
+import h5py
+
+
+def loadVNA(files, start=None, stop=None):
+    '''
+    Sweeps with start <= timestamp <= stop (unix time, None for no limit),
+    files with a frequency axis or traces different from the first one are skipped
+    returns frequency, trace names, timestamps and S (sweep, trace, point)
+    '''
+    freq = None
+    names = None
+    times = []
+    S = []
+    for file in files:
+        with h5py.File(file, 'r') as f:
+            t = f["/Data/datetime"][:]
+            keep = (t > 0)
+            if start is not None:
+                keep &= (t >= start)
+            if stop is not None:
+                keep &= (t <= stop)
+            idx = np.nonzero(keep)[0]
+            if len(idx) == 0:
+                continue
+            fileFreq = f["/Data/frequency"][:]
+            fileNames = [str(n) for n in f["/Data/S"].attrs['traces']]
+            if freq is None:
+                freq = fileFreq
+                names = fileNames
+            elif fileNames != names or not np.array_equal(fileFreq, freq):
+                print("FILE->", file)
+                print("Different frequency axis or traces, skipped")
+                continue
+            #rows are written in order, read the contiguous block at once
+            S.append(f["/Data/S"][idx[0]:idx[-1]+1][idx-idx[0]])
+            times.append(t[idx])
+    if freq is None:
+        return None, None, np.empty(0), None
+    return freq, names, np.concatenate(times), np.concatenate(S, axis=0)
+
+
+def portOrder(names):
+    '''
+    Index of each S parameter in Touchstone order (S11 S21 S12 S22 for two ports,
+    row by row otherwise)
+    '''
+    n = isqrt(len(names))
+    if n*n != len(names):
+        raise Exception("Touchstone needs a square number of traces")
+    pos = {name.upper(): i for i, name in enumerate(names)}
+    if n == 2:
+        order = ["S11", "S21", "S12", "S22"]
+    else:
+        order = ["S{}{}".format(i, j) for i in range(1, n+1) for j in range(1, n+1)]
+    try:
+        return n, [pos[o] for o in order]
+    except KeyError as e:
+        raise Exception("Missing trace {} for a {} port file".format(e, n))
+
+
+def touchstoneText(freq, S, names, z0=50):
+    '''
+    Touchstone (RI, Hz) content of one sweep, S (trace, point)
+    '''
+    n, order = portOrder(names)
+    data = np.empty((len(freq), 1 + 2*len(order)))
+    data[:, 0] = freq
+    data[:, 1::2] = S[order].real.T
+    data[:, 2::2] = S[order].imag.T
+    pair = " %.9g %.9g"
+    if n <= 2:
+        row = "%.9g" + pair*len(order) + "\n"
+    else:
+        #one matrix row per line
+        row = "%.9g" + (pair*n + "\n")*n
+    header = "! LibreVNA\n# HZ S RI R {}\n".format(z0)
+    #format every point with a single operation
+    return header + (row*len(freq)) % tuple(data.ravel())
+
+
+def exportTouchstone(files, outPath, start=None, stop=None, z0=50):
+    '''
+    Write one .sNp file per sweep between start and stop (unix time), returns the filenames
+    '''
+    freq, names, times, S = loadVNA(files, start, stop)
+    if freq is None:
+        print("No sweeps in the selected range")
+        return []
+    n, order = portOrder(names)
+    out = []
+    for t, s in zip(times, S):
+        filename = os.path.join(outPath, "vna_"+datetime.fromtimestamp(t).strftime("%Y%m%d-%H%M%S-%f")+".s{}p".format(n))
+        with open(filename, "w") as f:
+            f.write(touchstoneText(freq, s, names, z0))
+        out.append(filename)
+    return out
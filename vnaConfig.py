@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+"""vnaConfig.py:
+Desired VNA sweep state, applied like saConfig.
+"""
+
+__author__      = "Joab Apaza"
+__email__   = "japaza@igp.gob.pe"
+##########################################################################################
+
+from saConfig import saConfig
+
+
+class vnaConfig(saConfig):
+
+    startQuery = ":VNA:FREQ:START?"
+    stopQuery = ":VNA:FREQ:STOP?"
+
+    def __init__(self, start=1, stop=100, points=501, ifbw=1, power=-10, navg=1, traces=None):
+        '''
+        start, stop in MHz, IF bandwidth in KHz, stimulus power in dBm
+        traces: names to acquire, None for all the GUI traces
+        '''
+        self.start = start
+        self.stop = stop
+        self.points = points
+        self.ifbw = ifbw
+        self.power = power
+        self.navg = navg
+        self.traces = traces
+
+    def values(self):
+        return {
+            ":VNA:FREQ:START?": float(self.start*1000000),
+            ":VNA:FREQ:STOP?": float(self.stop*1000000),
+            ":VNA:ACQ:POINTS?": float(int(self.points)),
+            ":VNA:ACQ:IFBW?": float(self.ifbw*1000),
+            ":VNA:STIM:LVL?": float(self.power),
+            ":VNA:ACQ:AVG?": float(int(self.navg)),
+        }